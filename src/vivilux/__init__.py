@@ -28,7 +28,6 @@ from collections.abc import Iterator
 import math
 
 import numpy as np
-np.random.seed(seed=0)
 
 from .nets import *
 from .layers import *
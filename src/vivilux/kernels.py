@@ -0,0 +1,186 @@
+'''Optional numba backend for the per-step neuron update of a layer.
+
+    The elementwise updates of Layer.UpdateConductance (including FFFB),
+    Layer.StepActivity (including the NoisyXX1 activation) and
+    ActAvg.StepTime are each fused into a single nopython-compiled loop.
+    Layers use these kernels when compiled with backend="numba" (see
+    Net.Compile). If numba is not installed, HAS_NUMBA is False and layers
+    fall back to the NumPy implementation. numba is only imported (and the
+    kernels compiled) when a layer first requests the numba backend.
+
+    Batched layer state (2D arrays) always uses the NumPy implementation.
+'''
+
+# type checking
+from __future__ import annotations
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from .layers import Layer
+
+from importlib.util import find_spec
+import warnings
+
+import numpy as np
+
+from .activations import NoisyXX1
+
+HAS_NUMBA = find_spec("numba") is not None
+LOADED = False # kernels compiled with numba (see Load)
+
+def Load():
+    '''Imports numba and replaces the kernels of this module with their
+        nopython-compiled versions. Returns False if numba is unavailable.
+    '''
+    global HAS_NUMBA, LOADED
+    global _noisyXX1, _conductanceKernel, _activityKernel, _actAvgKernel
+    if LOADED or not HAS_NUMBA: return LOADED
+    try:
+        from numba import njit
+    except ImportError:
+        HAS_NUMBA = False
+        return False
+
+    # _noisyXX1 must be compiled first, it is called by _activityKernel
+    _noisyXX1 = njit(cache=True)(_noisyXX1)
+    _conductanceKernel = njit(cache=True)(_conductanceKernel)
+    _activityKernel = njit(cache=True)(_activityKernel)
+    _actAvgKernel = njit(cache=True)(_actAvgKernel)
+    LOADED = True
+    return True
+
+def Supports(layer: Layer, verbose: bool = True):
+    '''Returns True if the numba kernels can be used for the layer.
+    '''
+    if not Load():
+        if verbose:
+            warnings.warn("numba is not installed, using the NumPy backend.")
+        return False
+    # The kernel implements the exact NoisyXX1 activation only
+    if type(layer.actFn) is not NoisyXX1:
+        if verbose:
+            warnings.warn(f"Layer [{layer.name}] activation "
+                          f"{type(layer.actFn).__name__} is not supported by "
+                          "the numba backend, using the NumPy backend.")
+        return False
+    return hasattr(layer, "FFFB")
+
+def StepConductance(layer: Layer):
+    '''Integrates Ge, FFFB inhibition, GiSyn and Gi of the layer in place.
+    '''
+    p = layer.params
+    fffb = layer.FFFB
+    fbi = fffb.fbi
+    if not isinstance(fbi, float):
+        fbi = float(np.squeeze(fbi))
+    fffb.fbi, layer.Gi_FFFB = _conductanceKernel(layer.Ge, layer.GeRaw,
+                                                 layer.GiRaw, layer.GiSyn,
+                                                 layer.Gi, fffb.poolAct, fbi,
+                                                 p.GDt, p.MaxVsAvg, p.FF,
+                                                 p.FF0, p.FBDt, p.FFFBGi)
+
+def StepActivity(layer: Layer):
+    '''Integrates Inet, Vm and Act of the layer in place.
+    '''
+    p = layer.params
+    act = layer.actFn
+    layer.Inet = np.empty_like(layer.Act)
+    _activityKernel(layer.Act, layer.Vm, layer.Ge, layer.Gi, layer.Inet,
+                    p.VmDt, p.ActDt, p.VmExp, p.GbarE, p.GbarL, p.GbarI,
+                    p.ErevE, p.ErevL, p.ErevI, p.Thr, p.VmActThr, p.ErevIThr, p.LeakThr,
+                    p.ThrErevE, act.Gain, act.NVar, act.SigGainNVar,
+                    act.SigMultEff, act.SigValAt0, act.InterpRange,
+                    act.InterpVal, act.GainCor, act.GainCorRange)
+
+def StepActAvg(actAvg):
+    '''Updates the running activity averages of an ActAvg process in place.
+    '''
+    p = actAvg.pool.params
+    _actAvgKernel(actAvg.pool.getActivity(), actAvg.AvgSS, actAvg.AvgS,
+                  actAvg.AvgM, actAvg.AvgSLrn, p.SSdt, p.Sdt, p.Mdt,
+                  actAvg.LrnM)
+
+def _noisyXX1(x, Gain, NVar, SigGainNVar, SigMultEff, SigValAt0,
+              InterpRange, InterpVal, GainCor, GainCorRange):
+    '''Scalar NoisyXX1 (see activations.NoisyXX1).'''
+    if x < 0: # sigmoidal for < 0
+        exp = -(x * SigGainNVar)
+        if exp > 50: return 0.0 # zero for small values
+        return SigMultEff / (1 + np.exp(exp))
+    elif x < InterpRange:
+        interp = 1 - ((InterpRange - x) / InterpRange)
+        return SigValAt0 + interp*InterpVal
+    else: # gain corrected XX1
+        gainCorFact = (GainCorRange - (x / NVar)) / GainCorRange
+        gain = Gain
+        if gainCorFact > 0:
+            gain = Gain * (1 - GainCor*gainCorFact)
+        gx = gain * x
+        if gx <= 0: return 0.0
+        return gx/(gx+1)
+
+def _conductanceKernel(Ge, GeRaw, GiRaw, GiSyn, Gi, poolAct, fbi,
+                       GDt, MaxVsAvg, FF, FF0, FBDt, FFFBGi):
+    n = len(Ge)
+    sumGe = 0.0
+    maxGe = -np.inf
+    for i in range(n):
+        Ge[i] += GDt * (GeRaw[i] - Ge[i])
+        sumGe += Ge[i]
+        if Ge[i] > maxGe: maxGe = Ge[i]
+    avgGe = sumGe / n
+
+    sumAct = 0.0
+    for i in range(len(poolAct)):
+        sumAct += poolAct[i]
+    avgAct = sumAct / len(poolAct)
+
+    # FFFB inhibition
+    ffNetin = avgGe + MaxVsAvg * (maxGe - avgGe)
+    ffi = FF * max(ffNetin - FF0, 0.0)
+    fbi += FBDt * (avgAct - fbi)
+    GiFFFB = FFFBGi * (ffi + fbi)
+
+    for i in range(n):
+        GiSyn[i] += GDt * (GiRaw[i] - GiSyn[i])
+        Gi[i] = GiSyn[i] + GiFFFB
+
+    return fbi, GiFFFB
+
+def _activityKernel(Act, Vm, Ge, Gi, Inet,
+                    VmDt, ActDt, VmExp, GbarE, GbarL, GbarI,
+                    ErevE, ErevL, ErevI, Thr, VmActThr, ErevIThr, LeakThr, ThrErevE,
+                    Gain, NVar, SigGainNVar, SigMultEff, SigValAt0,
+                    InterpRange, InterpVal, GainCor, GainCorRange):
+    for i in range(len(Act)):
+        vm = Vm[i]
+        inet = (Ge[i] * GbarE * (ErevE - vm) +
+                GbarL * (ErevL - vm) +
+                Gi[i] * GbarI * (ErevI - vm)
+                )
+        Inet[i] = inet
+        if VmExp: # exact step for the current conductances
+            gTot = Ge[i] * GbarE + GbarL + Gi[i] * GbarI
+            vm += -np.expm1(-VmDt * gTot) / gTot * inet
+        else:
+            vm += VmDt * inet
+        Vm[i] = vm
+
+        # Vm-based activity below threshold, otherwise Ge-based
+        if Act[i] < VmActThr and vm <= Thr:
+            x = vm - Thr
+        else:
+            geThr = Gi[i] * GbarI * ErevIThr + LeakThr
+            geThr /= ThrErevE
+            x = Ge[i]*GbarE - geThr
+
+        newAct = _noisyXX1(x, Gain, NVar, SigGainNVar, SigMultEff,
+                           SigValAt0, InterpRange, InterpVal, GainCor,
+                           GainCorRange)
+        Act[i] += ActDt * (newAct - Act[i])
+
+def _actAvgKernel(Act, AvgSS, AvgS, AvgM, AvgSLrn, SSdt, Sdt, Mdt, LrnM):
+    for i in range(len(Act)):
+        AvgSS[i] += SSdt * (Act[i] - AvgSS[i])
+        AvgS[i] += Sdt * (AvgSS[i] - AvgS[i])
+        AvgM[i] += Mdt * (AvgS[i] - AvgM[i])
+        AvgSLrn[i] = (1-LrnM) * AvgS[i] + LrnM * AvgM[i]
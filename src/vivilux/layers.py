@@ -10,6 +10,7 @@ if TYPE_CHECKING:
     from .processes import Process, NeuralProcess, PhasicProcess
 
 from .processes import ActAvg, FFFB
+from . import kernels
 
 import numpy as np
 
@@ -20,6 +21,67 @@ from .optimizers import Simple
 from .visualize import Monitor
 from .photonics.neurons import Neuron, YunJhuModel
 
+class LayerParams:
+    '''Slot-based snapshot of the configuration dicts of a layer which are
+        read on every time step (DtParams, Gbar, Erev, FFFBparams). Constant
+        subexpressions of the inner loop are folded here once.
+
+        The per-step rates depend on DtParams["Integrator"]. With "euler"
+        each variable moves by rate * (target - value). With "exponential"
+        the rates are the exact decay over a step of Integ cycles,
+        1 - exp(-Integ/tau), and Vm is integrated exactly for the current
+        conductances (VmExp), which remains stable for large Integ.
+    '''
+    __slots__ = ("GDt", "VmDt", "ActDt", "VmExp", "GbarE", "GbarL", "GbarI",
+                 "ErevE", "ErevL", "ErevI", "Thr", "VmActThr", "ErevIThr",
+                 "LeakThr", "ThrErevE", "FFFBGi", "FF", "FF0", "FBDt",
+                 "MaxVsAvg", "SSdt", "Sdt", "Mdt")
+
+    def __init__(self, layer: Layer):
+        DtParams = layer.DtParams
+        Gbar = layer.Gbar
+        Erev = layer.Erev
+        FFFBparams = layer.FFFBparams
+        Thr = layer.actFn.Thr
+
+        Integ = DtParams["Integ"]
+        integrator = DtParams.get("Integrator", "euler")
+        if integrator == "euler":
+            self.GDt = Integ * DtParams["GDt"]
+            self.VmDt = DtParams["VmDt"]
+            self.ActDt = DtParams["VmDt"]
+            self.VmExp = False
+            self.FBDt = FFFBparams["FBDt"] * FFFBparams["FB"]
+            self.SSdt = layer.ActAvg.SSdt
+            self.Sdt = layer.ActAvg.Sdt
+            self.Mdt = layer.ActAvg.Mdt
+        elif integrator == "exponential":
+            self.GDt = -np.expm1(-Integ * DtParams["GDt"])
+            self.VmDt = Integ * DtParams["VmDt"] # decay per unit conductance
+            self.ActDt = -np.expm1(-Integ * DtParams["VmDt"])
+            self.VmExp = True
+            self.FBDt = -np.expm1(-Integ * FFFBparams["FBDt"] *
+                                  FFFBparams["FB"])
+            self.SSdt = -np.expm1(-Integ * layer.ActAvg.SSdt)
+            self.Sdt = -np.expm1(-Integ * layer.ActAvg.Sdt)
+            self.Mdt = -np.expm1(-Integ * layer.ActAvg.Mdt)
+        else:
+            raise ValueError(f"Unknown integrator: {integrator}")
+
+        self.GbarE, self.GbarL, self.GbarI = Gbar["E"], Gbar["L"], Gbar["I"]
+        self.ErevE, self.ErevL, self.ErevI = Erev["E"], Erev["L"], Erev["I"]
+
+        self.Thr = Thr
+        self.VmActThr = layer.actFn.VmActThr
+        self.ErevIThr = Erev["I"] - Thr
+        self.LeakThr = Gbar["L"] * (Erev["L"] - Thr)
+        self.ThrErevE = Thr - Erev["E"]
+
+        self.FFFBGi = FFFBparams["Gi"]
+        self.FF = FFFBparams["FF"]
+        self.FF0 = FFFBparams["FF0"]
+        self.MaxVsAvg = FFFBparams["MaxVsAvg"]
+
 class Layer:
     '''Base class for a layer that includes input matrices and activation
         function pairings. Each layer retains a seperate state for predict
@@ -64,6 +126,8 @@ class Layer:
 
         # Initialize layer variables
         self.net = None
+        self.params: LayerParams = None # frozen layerConfig (see Compile)
+        self.useNumba = False # use numba kernels for the time step
 
         self.GeRaw = np.zeros(length, dtype=self.dtype)
         self.Ge = np.zeros(length, dtype=self.dtype)
@@ -122,6 +186,12 @@ class Layer:
         # Attach OptThreshParams
         self.OptThreshParams = layerConfig["OptThreshParams"]
 
+        # Optionally replace the activation with its lookup-table version
+        # (configs written before ActLUT existed leave it disabled)
+        actLUT = layerConfig.get("ActLUT", {})
+        if actLUT.get("Enable", False) and hasattr(self.actFn, "LookupTable"):
+            self.actFn = self.actFn.LookupTable(actLUT.get("Resolution", 50))
+
         # Attach Averaging Process
         self.ActAvg = ActAvg(self, **layerConfig["ActAvg"]) # TODO add to std layerConfig and pass params here
         self.phaseProcesses.append(self.ActAvg)
@@ -135,25 +205,58 @@ class Layer:
         # Attach optimizer
         self.optimizer = layerConfig["optimizer"](**layerConfig["optArgs"])
 
+        self.Compile()
         self.isFloating = False
 
+    def Compile(self, backend: str = "numpy"):
+        '''Freezes the layer configuration into a LayerParams object used by
+            the time step functions. Changes to the configuration dicts
+            (DtParams, Gbar, Erev, FFFBparams) or the activation of an
+            attached layer are detected at the start of each trial, which
+            compiles the layer again (see RefreshParams). The rates derived
+            from the time constants (e.g. VmDt from VmTau) are computed when
+            the layer is attached, so set the rates directly afterwards.
+
+            The backend is either "numpy" or "numba" (see kernels.py), which
+            falls back to NumPy if numba is not available.
+        '''
+        if backend not in ["numpy", "numba"]:
+            raise ValueError(f"Unknown backend: {backend}")
+        self.backend = backend
+        self.params = LayerParams(self)
+        self.paramsKey = self.ParamsKey()
+        self.useNumba = backend == "numba" and kernels.Supports(self)
+
+    def ParamsKey(self) -> tuple:
+        '''Returns the configuration values which are frozen by Compile.
+        '''
+        return (tuple(self.DtParams.items()), tuple(self.Gbar.items()),
+                tuple(self.Erev.items()), tuple(self.FFFBparams.items()),
+                self.actFn, self.actFn.Thr, self.actFn.VmActThr,
+                self.ActAvg.SSdt, self.ActAvg.Sdt, self.ActAvg.Mdt)
+
+    def RefreshParams(self):
+        '''Compiles the layer again if its configuration changed since it was
+            last compiled.
+        '''
+        if self.ParamsKey() != self.paramsKey:
+            self.Compile(self.backend)
+
     def UpdateConductance(self):
         self.Integrate()
         self.RunProcesses()
 
+        if self.useNumba and self.Ge.ndim == 1:
+            return kernels.StepConductance(self)
+
         # Update conductances from raw inputs
-        self.Ge[:] += (self.DtParams["Integ"] *
-                       self.DtParams["GDt"] * 
-                       (self.GeRaw - self.Ge)
-                       )
+        GDt = self.params.GDt
+        self.Ge[:] += GDt * (self.GeRaw - self.Ge)
         
         # Call FFFB to update GiRaw
         self.FFFB.StepTime()
 
-        self.GiSyn[:] += (self.DtParams["Integ"] *
-                       self.DtParams["GDt"] * 
-                       (self.GiRaw - self.GiSyn)
-                       )
+        self.GiSyn[:] += GDt * (self.GiRaw - self.GiSyn)
         self.Gi[:] = self.GiSyn + self.Gi_FFFB # Add synaptic Gi to FFFB contribution
     
     def StepTime(self, time: float, debugData = None):
@@ -164,42 +267,92 @@ class Layer:
             self.EndStep(time, debugData=debugData)
             return
             
+        self.StepActivity()
+        self.EndStep(time, debugData=debugData)
 
-        # Aliases for readability
-        Erev = self.Erev
-        Gbar = self.Gbar
-        Thr = self.actFn.Thr
+    def StepActivity(self):
+        '''Integrates the membrane potential and rate-coded activity of the
+            layer over one time step.
+        '''
+        if self.useNumba and self.Act.ndim == 1:
+            kernels.StepActivity(self)
+        else:
+            self.IntegrateActivity()
+
+        neuralEnergy = self.neuron(self.Act)
+        if neuralEnergy.ndim > 1: # sum energy over batched samples
+            neuralEnergy = np.sum(neuralEnergy, axis=0)
+        self.neuralEnergy += neuralEnergy
+
+    def IntegrateActivity(self):
+        '''NumPy implementation of the Vm and Act update.'''
+        p = self.params
         
         # Update layer potentials
         Vm = self.Vm
-        self.Inet = (self.Ge * Gbar["E"] * (Erev["E"] - Vm) +
-                Gbar["L"] * (Erev["L"] - Vm) +
-                self.Gi * Gbar["I"] * (Erev["I"] - Vm)
+        self.Inet = (self.Ge * p.GbarE * (p.ErevE - Vm) +
+                p.GbarL * (p.ErevL - Vm) +
+                self.Gi * p.GbarI * (p.ErevI - Vm)
                 )
-        self.Vm[:] += self.DtParams["VmDt"] * self.Inet
+        if p.VmExp: # exact step for the current conductances
+            gTot = self.Ge * p.GbarE + p.GbarL + self.Gi * p.GbarI
+            self.Vm[:] += -np.expm1(-p.VmDt * gTot) / gTot * self.Inet
+        else:
+            self.Vm[:] += p.VmDt * self.Inet
 
         # Calculate conductance threshold
-        geThr = (self.Gi * Gbar["I"] * (Erev["I"] - Thr) +
-                 Gbar["L"] * (Erev["L"] - Thr)
-                )
-        geThr /= (Thr - Erev["E"])
+        geThr = self.Gi * p.GbarI * p.ErevIThr + p.LeakThr
+        geThr /= p.ThrErevE
 
         # Firing rate above threshold governed by conductance-based rate coding
-        newAct = self.actFn(self.Ge*Gbar["E"] - geThr)
-        
-        # Activity below threshold is nearly zero
+        ## except activity below threshold which is driven by Vm (nearly zero)
         mask = np.logical_and(
-            self.Act < self.actFn.VmActThr,
-            self.Vm <= self.actFn.Thr
+            self.Act < p.VmActThr,
+            self.Vm <= p.Thr
             )
-        newAct[mask] = self.actFn(self.Vm[mask] - Thr)
+        newAct = self.actFn(np.where(mask, self.Vm - p.Thr,
+                                     self.Ge*p.GbarE - geThr))
 
         # Update layer activities
-        self.Act[:] += self.DtParams["VmDt"] * (newAct - self.Act)
+        self.Act[:] += p.ActDt * (newAct - self.Act)
 
-        self.neuralEnergy += self.neuron(self.Act)
+    def SteadyActivity(self):
+        '''Sets the conductances, inhibition and membrane potential to their
+            equilibrium for the current sending activities and returns the
+            corresponding rate-coded activity. A fixed point of this map is an
+            equilibrium of StepTime (see Net.SolvePhase).
+        '''
+        p = self.params
 
-        self.EndStep(time, debugData=debugData)
+        GeRaw = 0
+        for mesh in self.excMeshes:
+            GeRaw = GeRaw + mesh.applySteady()[...,:len(self)]
+        GiRaw = 0
+        for mesh in self.inhMeshes:
+            GiRaw = GiRaw + mesh.applySteady()[...,:len(self)]
+
+        self.Ge[:] = GeRaw
+        self.GiSyn[:] = GiRaw
+        self.FFFB.SteadyState()
+        self.Gi[:] = self.GiSyn + self.Gi_FFFB
+
+        # Membrane potential where Inet = 0
+        gE = self.Ge * p.GbarE
+        gI = self.Gi * p.GbarI
+        self.Vm[:] = ((gE * p.ErevE + p.GbarL * p.ErevL + gI * p.ErevI) /
+                      (gE + p.GbarL + gI))
+
+        geThr = self.Gi * p.GbarI * p.ErevIThr + p.LeakThr
+        geThr /= p.ThrErevE
+        geAct = self.actFn(gE - geThr)
+        vmAct = self.actFn(self.Vm - p.Thr)
+
+        # Below threshold, the Vm-based activity holds while under VmActThr.
+        ## If it rises past VmActThr but the Ge-based activity falls under it,
+        ## StepTime chatters between both and the activity settles at VmActThr
+        subThr = np.where(vmAct < p.VmActThr, vmAct,
+                          np.where(geAct >= p.VmActThr, geAct, p.VmActThr))
+        return np.where(self.Vm > p.Thr, geAct, subThr)
 
     def Integrate(self):
         '''Integrates raw conductances from incoming synaptic connections.
@@ -207,12 +360,13 @@ class Layer:
             in a time integrated manner.
         '''
         for mesh in self.excMeshes:
-            self.GeRaw[:] += mesh.apply()[:len(self)]
+            self.GeRaw[:] += mesh.apply()[...,:len(self)]
 
         for mesh in self.inhMeshes:
-            self.GiRaw[:] += mesh.apply()[:len(self)]
+            self.GiRaw[:] += mesh.apply()[...,:len(self)]
 
     def InitTrial(self, Train: bool):
+        self.RefreshParams()
         if Train:
             # Update AvgL, AvgLLrn, ActPAvg, ActPAvgEff
             self.ActAvg.InitTrial()
@@ -246,6 +400,14 @@ class Layer:
         if not self.net.monitoring: return
         for monitor in self.monitors.values():
             monitor.update(self.snapshot)
+
+    def FlushMonitors(self, timeout: float = 1):
+        '''Draws the updates which the monitors have not drawn yet, waiting up
+            to `timeout` seconds for each background monitor.
+        '''
+        if not self.net.monitoring: return
+        for monitor in self.monitors.values():
+            monitor.Flush(timeout)
     
     def EnableMonitor(self, monitorName: str, enable: bool = True):
         self.monitors[monitorName].enable = enable
@@ -289,6 +451,22 @@ class Layer:
         self.GeRaw[:] = 0
         self.GiRaw[:] = 0
 
+    def StepTraces(self):
+        '''Equivalent to EndStep without monitoring or debugging. Used by
+            compiled nets.
+        '''
+        self.ActAvg.StepTime()
+        self.FFFB.UpdateAct()
+        self.GeRaw[:] = 0
+        self.GiRaw[:] = 0
+
+    def ClampExternal(self):
+        '''Clamps the layer to its EXTERNAL data for a time step without
+            monitoring or debugging. Used by compiled nets.
+        '''
+        self.Clamp(self.EXTERNAL, self.net.time)
+        self.StepTraces()
+
     def getActivity(self):
         return self.Act
 
@@ -312,6 +490,99 @@ class Layer:
         for mesh in self.excMeshes:
             mesh.XCAL.Reset()
 
+        for mesh in self.excMeshes + self.inhMeshes:
+            mesh.resetActivity()
+
+    def InitBatch(self, batchSize: int):
+        '''Expands the layer state with a leading batch dimension so that
+            `batchSize` independent samples can be simulated in lockstep. Each
+            sample starts from the current state of the layer.
+        '''
+        self.GeRaw = np.repeat(self.GeRaw[np.newaxis], batchSize, axis=0)
+        self.Ge = np.repeat(self.Ge[np.newaxis], batchSize, axis=0)
+
+        self.GiRaw = np.repeat(self.GiRaw[np.newaxis], batchSize, axis=0)
+        self.GiSyn = np.repeat(self.GiSyn[np.newaxis], batchSize, axis=0)
+        self.Gi = np.repeat(self.Gi[np.newaxis], batchSize, axis=0)
+
+        self.Act = np.repeat(self.Act[np.newaxis], batchSize, axis=0)
+        self.Vm = np.repeat(self.Vm[np.newaxis], batchSize, axis=0)
+
+        self.FFFB.InitBatch(batchSize)
+        self.ActAvg.InitBatch(batchSize)
+
+        for mesh in self.excMeshes + self.inhMeshes:
+            mesh.InitBatch(batchSize)
+
+    def EndBatch(self, index: int = -1):
+        '''Removes the batch dimension from the layer state, keeping the state
+            of the sample at `index`.
+        '''
+        self.GeRaw = self.GeRaw[index].copy()
+        self.Ge = self.Ge[index].copy()
+
+        self.GiRaw = self.GiRaw[index].copy()
+        self.GiSyn = self.GiSyn[index].copy()
+        self.Gi = self.Gi[index].copy()
+
+        self.Act = self.Act[index].copy()
+        self.Vm = self.Vm[index].copy()
+
+        for phase, activity in self.phaseHist.items():
+            if activity.ndim > 1:
+                self.phaseHist[phase] = activity[index].copy()
+
+        self.FFFB.EndBatch(index)
+        self.ActAvg.EndBatch(index)
+
+        for mesh in self.excMeshes + self.inhMeshes:
+            mesh.EndBatch(index)
+
+    def BatchArrays(self) -> list[tuple[object, str]]:
+        '''Returns the (owner, attribute) of each array of the layer state
+            which carries a batch dimension (see InitBatch).
+        '''
+        arrays = [(self, name) for name in ["GeRaw", "Ge", "GiRaw", "GiSyn",
+                                            "Gi", "Act", "Vm"]]
+        arrays += [(self.FFFB, "fbi")]
+        arrays += [(self.ActAvg, name) for name in ["AvgSS", "AvgS", "AvgM",
+                                                    "AvgSLrn"]]
+        arrays += [(mesh, name) for mesh in self.excMeshes + self.inhMeshes
+                   for name in ["lastAct", "inAct"]]
+        return arrays
+
+    def SplitBatch(self, rows: np.ndarray) -> tuple[list, dict]:
+        '''Reduces the batched layer state to the samples selected by `rows`
+            and returns the full state, to be passed to JoinBatch.
+        '''
+        arrays = [getattr(owner, name) for owner, name in self.BatchArrays()]
+        phaseHist = dict(self.phaseHist)
+        for (owner, name), array in zip(self.BatchArrays(), arrays):
+            setattr(owner, name, array[rows].copy())
+        for phase, activity in phaseHist.items():
+            if activity.ndim > 1:
+                self.phaseHist[phase] = activity[rows].copy()
+        self.FFFB.poolAct = self.getActivity()
+        for mesh in self.excMeshes + self.inhMeshes:
+            mesh.netinVersion = None
+        return arrays, phaseHist
+
+    def JoinBatch(self, state: tuple[list, dict], rows: np.ndarray):
+        '''Writes the state of the samples selected by SplitBatch back into
+            the full batched state.
+        '''
+        arrays, phaseHist = state
+        for (owner, name), array in zip(self.BatchArrays(), arrays):
+            array[rows] = getattr(owner, name)
+            setattr(owner, name, array)
+        for phase, activity in phaseHist.items():
+            if activity.ndim > 1:
+                activity[rows] = self.phaseHist[phase]
+        self.phaseHist = phaseHist
+        self.FFFB.poolAct = self.getActivity()
+        for mesh in self.excMeshes + self.inhMeshes:
+            mesh.netinVersion = None
+
 
     def Clamp(self, data, time: float, monitoring = False, debugData=None):
         clampData = data.copy()
@@ -325,11 +596,18 @@ class Layer:
         # Update other internal variables according to activity
         self.Vm = self.actFn.Thr + self.Act/self.actFn.Gain
 
-    def Learn(self, batchComplete=False, dwtLog = {}):
-        if self.isInput or self.freeze: return
-        for mesh in self.excMeshes:
-            if not mesh.trainable: continue
-            mesh.Update(dwtLog=dwtLog)
+    def Learn(self, batchComplete=True, dwtLog = {}):
+        '''Updates the trainable meshes. Weight changes are accumulated in
+            each mesh until `batchComplete` is True.
+        '''
+        for mesh in self.TrainableMeshes():
+            mesh.Update(dwtLog=dwtLog, batchComplete=batchComplete)
+
+    def TrainableMeshes(self) -> list[Mesh]:
+        '''Returns the meshes updated by Learn.
+        '''
+        if self.isInput or self.freeze: return []
+        return [mesh for mesh in self.excMeshes if mesh.trainable]
         
     def Debug(self, **kwargs):
         if "activityLog" in kwargs:
@@ -409,7 +687,7 @@ class Layer:
             self.inhMeshes.append(mesh)
     
     def __len__(self):
-        return len(self.Act)
+        return self.Act.shape[-1]
 
     def __str__(self) -> str:
         layStr = f"{self.name} ({len(self)}): \n\tActivation = {self.act}\n\tLearning"
@@ -18,6 +18,7 @@ class Mesh:
     '''Base class for meshes of synaptic elements.
     '''
     count = 0
+    threadSafe = True # Update may run concurrently with other meshes
     def __init__(self, 
                  size: int,
                  inLayer: Layer,
@@ -40,6 +41,13 @@ class Mesh:
                  softBound = True,
                  device = Generic(),
                  **kwargs):
+        # weight version, incremented whenever the weights change
+        self.version = 0
+        self.cache = None # effective matrix of the weights (see get)
+        self.cacheVersion = None
+        self.holdKey = None # (version, DT, device) of holdCost (see DeviceHold)
+        self.holdCost = None
+
         self.shape = (size, len(inLayer))
         self.size = size if size > len(inLayer) else len(inLayer)
         self.Off = Off
@@ -75,14 +83,24 @@ class Mesh:
         self.OptThreshParams = inLayer.OptThreshParams
         self.lastAct = np.zeros(self.size, dtype=self.dtype)
         self.inAct = np.zeros(self.size, dtype=self.dtype)
+        self.inBuffer = np.zeros(self.size, dtype=self.dtype) # padded input
+
+        # running contribution to the receiving layer (delta-sender)
+        self.netin = 0
+        self.netinVersion = None # weight version used by netin
 
         # flag to track when matrix updates (for nontrivial meshes like MZI)
         self.modified = False
 
+        # accumulated weight changes for minibatch learning
+        self.batchDelta = 0
+        self.batchCount = 0
+
         self.name = f"MESH_{Mesh.count}"
         Mesh.count += 1
 
         self.trainable = True
+        self.rngStream = None # random stream used by Update (see rng)
         self.sndActAvg = inLayer.ActAvg
         self.rcvActAvg = None
 
@@ -92,6 +110,44 @@ class Mesh:
 
         self.AttachDevice(device)
 
+    @property
+    def matrix(self) -> np.ndarray:
+        '''Synaptic weights. Assigning a new matrix counts as a change of
+            the weights (see WeightsChanged).
+        '''
+        return self._matrix
+
+    @matrix.setter
+    def matrix(self, matrix: np.ndarray):
+        self._matrix = matrix
+        self.WeightsChanged()
+
+    def WeightsChanged(self):
+        '''Increments the weight version, which invalidates the cached
+            effective matrix (see get) and the delta-sender netin of this
+            mesh and of any mesh derived from it (e.g. TransposeMesh).
+
+            Must be called after modifying the matrix or Gscale in place.
+        '''
+        self.version += 1
+
+    def WeightVersion(self):
+        '''Returns a stamp which changes whenever the effective matrix of
+            the mesh changes.
+        '''
+        return self.version
+
+    @property
+    def rng(self):
+        '''Random stream used by Update. This is the global NumPy stream
+            unless the mesh was given its own by Net.ParallelLearn.
+        '''
+        return np.random if self.rngStream is None else self.rngStream
+
+    @rng.setter
+    def rng(self, stream: np.random.RandomState):
+        self.rngStream = stream
+
     def GetEnergy(self, device: Device = None):
         '''Returns integrated energy over the course of the simulation.
             If a device is provided, it calculates the energy from the given
@@ -125,17 +181,23 @@ class Mesh:
         self.setIntegration = 0
         self.resetIntegration = 0
 
-    def DeviceHold(self):
+    def DeviceHold(self, numSamples: int = 1):
         '''Calls the hold function for each device in the mesh according
-            to the current parameters.
+            to the current parameters. `numSamples` is the number of samples
+            simulated in lockstep during the time step.
 
             This function should be overwritten for meshses with different
             parameter structures.
         '''
-        DT = self.inLayer.net.DELTA_TIME
-        self.holdEnergy += self.device.Hold(self.matrix, DT)
-
-        self.holdIntegration += np.sum(self.matrix)
+        DT = numSamples * self.inLayer.net.DELTA_TIME
+        key = (self.version, DT, self.device)
+        if self.holdKey != key: # hold costs only change with the weights
+            self.holdCost = (self.device.Hold(self.matrix, DT),
+                             np.sum(self.matrix))
+            self.holdKey = key
+        self.holdEnergy += self.holdCost[0]
+
+        self.holdIntegration += numSamples * self.holdCost[1]
         self.holdTime += DT
 
 
@@ -161,6 +223,7 @@ class Mesh:
 
     def setGscale(self):
         # TODO: handle case for inhibitory mesh
+        self.WeightsChanged()
         totalRel = np.sum([mesh.RelScale for mesh in self.rcvLayer.excMeshes], dtype=self.dtype)
         self.Gscale = self.AbsScale * self.RelScale 
         self.Gscale /= totalRel if totalRel > 0 else 1
@@ -174,19 +237,43 @@ class Mesh:
         self.Gscale *= sc
 
     def get(self):
+        '''Returns the effective matrix, which is cached until the weights
+            change (see WeightsChanged). The result must not be modified in
+            place.
+        '''
+        if self.cacheVersion != self.WeightVersion():
+            self.cache = self.getEffective()
+            self.cacheVersion = self.WeightVersion()
+        return self.cache
+
+    def getEffective(self):
+        '''Calculates the effective matrix from the weights.
+
+            Overwrite this function for meshes which derive their matrix
+            differently.
+        '''
         return self.Gscale * self.matrix
     
     def getInput(self):
-        act = self.inLayer.getActivity()
-        pad = self.size - act.size
-        return np.pad(act, pad_width=(0,pad))
+        return self.fillBuffer(self.inLayer.getActivity(), self.size)
+
+    def fillBuffer(self, act, size):
+        '''Copies the sending activity into a preallocated buffer of length
+            `size` whose padding stays zero, so that no array is allocated
+            each time step. The buffer is only reallocated when the shape
+            of the sending activity changes (e.g. batched samples).
+        '''
+        shape = act.shape[:-1] + (size,)
+        if self.inBuffer.shape != shape:
+            self.inBuffer = np.zeros(shape, dtype=act.dtype)
+        self.inBuffer[...,:act.shape[-1]] = act
+        return self.inBuffer
 
     def apply(self):
-        self.DeviceHold()
         data = self.getInput()
+        self.DeviceHold(len(data) if data.ndim > 1 else 1)
 
         # Implement delta-sender behavior (thresholds changes in conductance)
-        ## NOTE: this does not reduce matrix multiplications like it does in Leabra
         delta = data - self.lastAct
 
         cond1 = data <= self.OptThreshParams["Send"]
@@ -203,17 +290,74 @@ class Mesh:
 
         self.inAct[:] += delta
 
-        return self.applyTo(self.inAct[:self.shape[1]])
+        if self.netinVersion != self.WeightVersion(): # weights changed, recompute full contribution
+            self.netin = self.applyTo(self.inAct[...,:self.shape[1]])
+            self.netinVersion = self.WeightVersion()
+            return self.netin
+
+        # Only the senders which signalled a change contribute matrix work
+        sendDelta = delta[...,:self.shape[1]]
+        changed = sendDelta if sendDelta.ndim == 1 else np.any(sendDelta, axis=0)
+        changed = np.flatnonzero(changed)
+        self.netin += self.applyChanged(sendDelta, changed)
+
+        return self.netin
+
+    def applySteady(self):
+        '''Applies the mesh to the steady state of the delta-sender, where
+            only activities above the sending threshold are transmitted.
+        '''
+        data = self.getInput()
+        data = np.where(data > self.OptThreshParams["Send"], data, 0)
+        return self.applyTo(data[...,:self.shape[1]])
+
+    def applyChanged(self, delta, changed):
+        '''Applies only the columns of the mesh belonging to the senders in
+            `changed` to their change in activity `delta`. This is the event-
+            driven counterpart to applyTo used by the delta-sender in apply,
+            so steps where few senders change cost little matrix work.
+
+            Overwrite this function for meshes where applyTo is not linear.
+        '''
+        if len(changed) == 0: return 0
+        synapticWeights = self.get()[:self.shape[0], :self.shape[1]]
+        synapticWeights = synapticWeights[:,changed]
+        if delta.ndim > 1: # batched samples (B, n)
+            return (synapticWeights @ delta[:,changed,np.newaxis])[...,0]
+        return synapticWeights @ delta[changed]
             
     def applyTo(self, data):
         try:
             synapticWeights = self.get()[:self.shape[0], :self.shape[1]]
+            if data.ndim > 1: # batched samples (B, n) are applied row by row
+                # stacked matrix-vector products round exactly like the
+                ## single sample path (a (B,n) @ W.T product does not)
+                return (synapticWeights @ data[:,:self.shape[1],np.newaxis])[...,0]
             return np.array(synapticWeights @ data[:self.shape[1]]).reshape(-1) # TODO: check for slowdown from this trick to support single-element layer
         except ValueError as ve:
             raise ValueError(f"Attempted to apply {data} (shape: {data.shape})"
                              f" to mesh of dimension: {self.shape}")
             # print(ve)
 
+    def resetActivity(self):
+        '''Resets the delta-sender traces of the sending activity.'''
+        self.lastAct[:] = 0
+        self.inAct[:] = 0
+        self.netinVersion = None
+
+    def InitBatch(self, batchSize: int):
+        '''Expands the delta-sender state with a leading batch dimension so
+            that `batchSize` samples can be applied in lockstep.
+        '''
+        self.lastAct = np.repeat(self.lastAct[np.newaxis], batchSize, axis=0)
+        self.inAct = np.repeat(self.inAct[np.newaxis], batchSize, axis=0)
+        self.netinVersion = None
+
+    def EndBatch(self, index: int = -1):
+        self.lastAct = self.lastAct[index].copy()
+        self.inAct = self.inAct[index].copy()
+        self.netinVersion = None
+
     def AttachLayer(self, rcvLayer: Layer):
         self.rcvLayer = rcvLayer
         self.XCAL = XCAL() #TODO pass params from layer or mesh config
@@ -292,15 +436,28 @@ class Mesh:
 
     def Update(self,
                dwtLog = None,
+               batchComplete = True,
                ):
         '''Calculates and applies the weight update according to the
             learning rule and updates other related internal variables.
 
+            Deltas are accumulated until `batchComplete` is True, at which
+            point their average is applied in a single update.
+
             This function should apply to all meshes.
         '''
         delta, m, n = self.CalculateUpdate(dwtLog=dwtLog)
+        self.batchDelta = self.batchDelta + delta
+        self.batchCount += 1
+        if not batchComplete: return
+
+        delta = self.batchDelta / self.batchCount
+        self.batchDelta = 0
+        self.batchCount = 0
+
         self.DeviceUpdate(delta)
         self.ApplyUpdate(delta, m, n)
+        self.WeightsChanged()
         self.WtBalance()
 
         if dwtLog is not None:
@@ -374,6 +531,7 @@ class Mesh:
             purely linearly since the maximum and minimum possible weight is
             bounded by physical constraints.
         '''
+        self.WeightsChanged() # matrix is modified in place
         mask1 = self.linMatrix <= 0
         self.matrix[mask1] = 0
 
@@ -392,6 +550,7 @@ class Mesh:
         '''This function is only called when the weights are set manually to
             ensure that the linear weights (linMatrix) are accurately tracked.
         '''
+        self.WeightsChanged() # matrix is modified in place
         mask1 = self.matrix <= 0
         self.matrix[mask1] = 0
 
@@ -430,13 +589,14 @@ class TransposeMesh(Mesh):
     def set(self):
         raise Exception("Feedback mesh has no 'set' method.")
 
-    def get(self):
-        return self.Gscale * self.mesh.get().T 
+    def WeightVersion(self):
+        return (self.version, self.mesh.WeightVersion())
+
+    def getEffective(self):
+        return self.Gscale * self.mesh.get().T
     
     def getInput(self):
-        act = self.mesh.inLayer.getActivity()
-        pad = self.shape[1] - act.size
-        return np.pad(act, pad_width=(0,pad))
+        return self.fillBuffer(self.mesh.inLayer.getActivity(), self.shape[1])
 
     def Update(self,
                debugDwt = None,
@@ -10,7 +10,9 @@ if TYPE_CHECKING:
     from .meshes import Mesh
 
 from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 import math
+import os
 
 import numpy as np
 
@@ -20,6 +22,7 @@ from .metrics import RMSE
 from .optimizers import Simple
 from .visualize import Monitor
 from .photonics.devices import Device
+from .profiler import Profiler
 
 
 
@@ -57,6 +60,7 @@ layerConfig_std = {
         "VmTau" : 3.3, # membrane potential and rate-code activation time constant in cycles, which should be milliseconds typically (roughly, how long it takes for value to change significantly -- 1.4x the half-life) -- reflects the capacitance of the neuron in principle -- biological default for AdEx spiking model C = 281 pF = 2.81 normalized -- for rate-code activation, this also determines how fast to integrate computed activation values over time
         "GTau" : 1.4, # time constant for integrating synaptic conductances, in cycles, which should be milliseconds typically (roughly, how long it takes for value to change significantly -- 1.4x the half-life) -- this is important for damping oscillations -- generally reflects time constants associated with synaptic channels which are not modeled in the most abstract rate code models (set to 1 for detailed spiking models with more realistic synaptic currents) -- larger values (e.g., 3) can be important for models with higher conductances that otherwise might be more prone to oscillation.
         "AvgTau" : 200, # for integrating activation average (ActAvg), time constant in trials (roughly, how long it takes for value to change significantly) -- used mostly for visualization and tracking *hog* units
+        "Integrator": "euler", # "euler" or "exponential" -- exponential Euler integrates each step exactly for the current conductances and remains stable with Integ of 2-4 (reduce numTimeSteps of each phase by the same factor)
         
     },
     "ActAvg": {
@@ -82,6 +86,10 @@ layerConfig_std = {
         "Send": 0.1,
         "Delta": 0.005,
     },
+    "ActLUT": {
+        "Enable": False, # use an interpolated lookup table for the activation
+        "Resolution": 50, # table points per unit of NVar (max error ~1e-5 at 50)
+    },
     "optimizer": Simple,
     "optArgs": {},
     "ffMeshConfig": ffMeshConfig_std,
@@ -99,11 +107,12 @@ layerConfig_std = {
 
 phaseConfig_std = {
     "minus": {
-        "numTimeSteps": 75,
+        "numTimeSteps": 75, # (maximum) number of time steps in the phase
         "isOutput": True,
         "isLearn": False,
         "clampLayers": {"input": 0,
                     },
+        "Settle": None, # optional early termination (see settleConfig_std)
     },
     "plus": {
         "numTimeSteps": 25,
@@ -112,9 +121,26 @@ phaseConfig_std = {
         "clampLayers": {"input": 0,
                     "target": -1,
                     },
+        "Settle": None,
     },
 }
 
+# Example convergence criterion for the "Settle" entry of a phase
+settleConfig_std = {
+    "tolerance": 1e-2, # max |change in Act| across unclamped layers per step
+    "numSteps": 5, # consecutive steps below tolerance to end the phase
+    "minTimeSteps": 10, # minimum number of time steps in the phase
+}
+
+# Steady-state solver for inference (see Net.SolvePhase)
+solverConfig_std = {
+    "tolerance": 1e-4, # max |Act - f(Act)| at the fixed point
+    "maxIter": 100, # iterations before falling back to time stepping
+    "memory": 5, # number of previous iterates used by Anderson acceleration
+    "damping": 1, # mixing factor of the fixed point map (1 = undamped)
+    "warmupSteps": 20, # time steps before solving (selects the equilibrium)
+}
+
 runConfig_std = {
     "DELTA_TIME": 0.001,
     "metrics": {
@@ -136,6 +162,69 @@ runConfig_std = {
 
 
 ###<------ NET CLASSES ------>###
+class Settling:
+    '''Tracks the convergence criterion of a phase (see settleConfig_std).
+        Calling the object after each time step returns True once the
+        activity of the given layers has settled.
+    '''
+    __slots__ = ("tolerance", "numSteps", "minTimeSteps", "layers", "prevActs",
+                 "count")
+
+    def __init__(self, settleConfig: dict, layers: list[Layer]):
+        self.tolerance = settleConfig["tolerance"]
+        self.numSteps = settleConfig.get("numSteps", 1)
+        self.minTimeSteps = settleConfig.get("minTimeSteps", 0)
+        self.layers = layers
+        self.prevActs = [layer.getActivity().copy() for layer in layers]
+        self.count = 0
+
+    def __call__(self, timeStep: int) -> bool:
+        maxDelta = 0
+        for layer, prevAct in zip(self.layers, self.prevActs):
+            act = layer.getActivity()
+            maxDelta = max(maxDelta, np.max(np.abs(act - prevAct)))
+            prevAct[:] = act
+
+        self.count = self.count + 1 if maxDelta < self.tolerance else 0
+        return timeStep+1 >= self.minTimeSteps and self.count >= self.numSteps
+
+class PhasePlan:
+    '''Precomputed execution plan for a single phase of a compiled net
+        (see Net.Compile). Holds the ordered per-step operations so that the
+        time loop runs without any dictionary lookups or debug branches.
+    '''
+    __slots__ = ("numTimeSteps", "settle", "unclamped", "clamped",
+                 "conductanceOps", "activityOps", "phasicProcesses")
+
+    def __init__(self, net: Net, phaseName: str):
+        layerLists = net.layerDict[phaseName]
+        self.numTimeSteps = net.phaseConfig[phaseName]["numTimeSteps"]
+        self.settle = net.phaseConfig[phaseName].get("Settle")
+        self.unclamped = layerLists["unclamped"]
+        self.clamped = list(layerLists["clamped"].items())
+
+        self.conductanceOps = [layer.UpdateConductance for layer in net.layers]
+
+        # StepTime for each unclamped layer
+        self.activityOps = []
+        for layer in layerLists["unclamped"]:
+            self.activityOps.append(layer.StepActivity)
+            self.activityOps.append(layer.StepTraces)
+
+        # Update internal variables of clamped layers
+        ## NOTE: mirrors the equivalence checking branches of UpdateActivity
+        for index, (_, layer) in enumerate(self.clamped):
+            if index == 0:
+                self.activityOps.append(layer.StepTraces)
+            else:
+                self.activityOps.append(layer.ClampExternal)
+
+        self.phasicProcesses = [(layer, [process.StepPhase for process
+                                         in layer.phaseProcesses
+                                         if phaseName in process.phases or
+                                         "all" in process.phases])
+                                for layer in net.layers]
+
 class Net:
     '''Base class for neural networks with Hebbian-like learning
     '''
@@ -175,6 +264,34 @@ class Net:
         # For early stopping learning process
         self.lrnThresh = 0
 
+        # Execution plans for each phase (see Compile)
+        self.plans: dict[str, PhasePlan] = None
+        self.backend = "numpy"
+
+        # Number of time steps of each trial in the current epoch
+        self.trialCycles = []
+
+        # Steady-state inference (see SolvePhase)
+        self.solver: dict = None
+        self.trialResiduals = []
+        self.trialConverged = []
+
+        # Thread pool for updating meshes concurrently (see ParallelLearn),
+        # created on first use and left out of copies of the net
+        self.learnWorkers = 1
+        self.learnPool: ThreadPoolExecutor = None
+
+        # Timing of the last profiled run (see Learn)
+        self.profiler: Profiler = None
+
+    def __getstate__(self): # thread pools can not be copied or pickled
+        state = vars(self).copy()
+        state["learnPool"] = None
+        return state
+
+    def __setstate__(self, state):
+        vars(self).update(state)
+
     def PreallocateResultDict(self):
         '''Pre-allocate a dict to store the results
         '''
@@ -201,6 +318,82 @@ class Net:
         self.layerDict["outputLayers"] = {}
         for dataName, index in self.runConfig["outputLayers"].items():
             self.layerDict["outputLayers"][dataName] = self.layers[index]
+
+        self.plans = None # layer lists changed, net must be recompiled
+
+    def Compile(self, backend: str = "numpy"):
+        '''Freezes the layer configurations into slot-based parameters and
+            precomputes an execution plan for each phase. While monitoring
+            and debugging are off, StepPhase then runs the plan instead of
+            the generic time loop.
+
+            The net must be compiled again after adding layers or modifying
+            the phaseConfig. Edits to the configuration dicts of a layer are
+            picked up at the next trial (see Layer.RefreshParams), except
+            for the time constants (e.g. VmTau, GTau), whose rates (VmDt,
+            GDt) are computed when the layer is added and must be set
+            directly.
+
+            - backend: "numpy" or "numba" for the layer time step kernels
+              (see kernels.py)
+        '''
+        self.backend = backend
+        for layer in self.layers:
+            layer.Compile(backend)
+
+        self.plans = {phaseName: PhasePlan(self, phaseName)
+                      for phaseName in self.phaseConfig}
+
+    def ParallelLearn(self, numWorkers: int = None, seed: int = 0):
+        '''Updates the trainable meshes of all layers concurrently in a pool
+            of `numWorkers` threads (defaults to the number of cores) during
+            the learning phases. The iterative mesh updates (e.g. LAMM in
+            MZImesh) spend most of their time in NumPy, which releases the
+            GIL, and each mesh only modifies its own state.
+
+            Each mesh is given an independent random stream spawned from
+            `seed`, so results do not depend on the scheduling of the
+            threads. Meshes which are not thread safe (e.g. HardMZI) are
+            updated serially after the pool.
+
+            With numWorkers <= 1 the meshes are updated serially (with the
+            random streams kept). Call again after adding connections.
+
+            NOTE: for many small meshes, limiting the BLAS threads (e.g.
+            OMP_NUM_THREADS=1) avoids oversubscribing the cores.
+        '''
+        meshes = [mesh for layer in self.layers for mesh in layer.excMeshes]
+        streams = np.random.SeedSequence(seed).spawn(len(meshes))
+        for mesh, stream in zip(meshes, streams):
+            mesh.rng = np.random.RandomState(np.random.MT19937(stream))
+
+        if self.learnPool is not None:
+            self.learnPool.shutdown()
+            self.learnPool = None
+        self.learnWorkers = os.cpu_count() if numWorkers is None else numWorkers
+
+    def UpdateMeshes(self, batchComplete: bool = True, dwtLog = None):
+        '''Updates the trainable meshes of each layer, concurrently if a
+            pool was requested by ParallelLearn.
+        '''
+        if self.learnWorkers <= 1:
+            for layer in self.layers:
+                layer.Learn(batchComplete=batchComplete, dwtLog=dwtLog)
+            return
+
+        if self.learnPool is None:
+            self.learnPool = ThreadPoolExecutor(max_workers=self.learnWorkers,
+                                                thread_name_prefix=self.name)
+
+        meshes = [mesh for layer in self.layers
+                  for mesh in layer.TrainableMeshes()]
+        def update(mesh: Mesh):
+            mesh.Update(dwtLog=dwtLog, batchComplete=batchComplete)
+        # list() waits for all updates and raises their exceptions
+        list(self.learnPool.map(update, [mesh for mesh in meshes
+                                         if mesh.threadSafe]))
+        for mesh in meshes:
+            if not mesh.threadSafe: update(mesh)
                 
     def AddLayer(self, layer: Layer, layerConfig: dict = None):
         # index = len(self.layers)
@@ -392,15 +585,29 @@ class Net:
             the generation of an expectation versus observation of outcome in
             Prof. O'Reilly's error-driven local learning framework.
         '''
+        if self.solver is not None:
+            return self.SolvePhase(phaseName, **dataVectors)
+
+        if self.plans is not None and not self.monitoring and not debugData:
+            return self.RunPlan(phaseName, **dataVectors)
+
         numTimeSteps = self.phaseConfig[phaseName]["numTimeSteps"]
+        settle = self.phaseConfig[phaseName].get("Settle")
         
         self.ClampLayers(phaseName, **dataVectors)
+        if settle is not None:
+            settling = Settling(settle, self.layerDict[phaseName]["unclamped"])
 
+        numSteps = 0 # the phase may have no time steps
         for timeStep in range(numTimeSteps):
             self.UpdateConductances()
             self.UpdateActivity(phaseName, debugData=debugData, **dataVectors)
 
             self.time += self.DELTA_TIME
+            numSteps += 1
+
+            if settle is not None and settling(timeStep):
+                break
 
         # Execute phasic processes (including XCAL)
         for layer in self.layers:
@@ -412,24 +619,208 @@ class Net:
                 if phaseName in process.phases or "all" in process.phases:
                     process.StepPhase()
 
-    def StepTrial(self, runType: str, debugData = {}, **dataVectors):
+        return numSteps
+
+    def RunPlan(self, phaseName: str, **dataVectors):
+        '''Compiled equivalent of StepPhase (see Compile).
+        '''
+        plan = self.plans[phaseName]
+        conductanceOps = plan.conductanceOps
+        activityOps = plan.activityOps
+        DELTA_TIME = self.DELTA_TIME
+
+        for index, (dataName, clampedLayer) in enumerate(plan.clamped):
+            if index == 0:
+                clampedLayer.Clamp(dataVectors[dataName], self.time)
+            else:
+                clampedLayer.EXTERNAL = dataVectors[dataName]
+
+        settling = (None if plan.settle is None else
+                    Settling(plan.settle, plan.unclamped))
+
+        numSteps = 0 # the phase may have no time steps
+        for timeStep in range(plan.numTimeSteps):
+            for op in conductanceOps:
+                op()
+            for op in activityOps:
+                op()
+
+            self.time += DELTA_TIME
+            numSteps += 1
+
+            if settling is not None and settling(timeStep):
+                break
+
+        for layer, processes in plan.phasicProcesses:
+            #record phase activity at the end of each phase
+            layer.phaseHist[phaseName] = layer.getActivity().copy()
+
+            # Execute phasic processes (including XCAL)
+            for process in processes:
+                process()
+
+        return numSteps
+
+    def SolvePhase(self, phaseName: str, **dataVectors):
+        '''Solves for the equilibrium of the rate-coded dynamics of a phase
+            instead of integrating them over time. The activity of the
+            unclamped layers is iterated through Layer.SteadyActivity with
+            Anderson acceleration (configured by self.solver, see
+            solverConfig_std). Batched samples are solved independently:
+            each sample stops iterating once its own residual reaches the
+            tolerance.
+
+            Samples whose residual does not reach the tolerance within
+            maxIter iterations are time stepped from their last iterate.
+            The residual and convergence of each sample are recorded in
+            trialResiduals and trialConverged. Returns the number of
+            iterations (each costs about one time step), per sample for
+            batched trials.
+        '''
+        solver = self.solver
+        tolerance = solver["tolerance"]
+        memory = solver["memory"]
+        damping = solver["damping"]
+        maxIter = solver["maxIter"]
+
+        self.ClampLayers(phaseName, **dataVectors)
+        for dataName, clampedLayer in self.layerDict[phaseName]["clamped"].items():
+            clampedLayer.Clamp(dataVectors[dataName], self.time)
+
+        # Time step towards the basin of attraction of the equilibrium
+        warmupSteps = solver.get("warmupSteps", 0)
+        for timeStep in range(warmupSteps):
+            self.UpdateConductances()
+            self.UpdateActivity(phaseName, **dataVectors)
+            self.time += self.DELTA_TIME
+
+        layers = self.layerDict[phaseName]["unclamped"]
+        shapes = [layer.getActivity().shape for layer in layers]
+        splits = np.cumsum([shape[-1] for shape in shapes])[:-1]
+        flatten = lambda acts: np.concatenate([np.atleast_2d(act) for act in acts],
+                                              axis=-1) # (batch, neurons)
+        isBatched = len(shapes[0]) > 1
+
+        def SteadyMap(x):
+            for layer, shape, act in zip(layers, shapes, np.split(x, splits, axis=-1)):
+                layer.Act = act.reshape(shape).copy()
+            return flatten([layer.SteadyActivity() for layer in layers])
+
+        # Anderson acceleration of the fixed point iteration x = g(x)
+        x = flatten([layer.getActivity() for layer in layers])
+        f = SteadyMap(x) - x
+        active = np.ones(len(x), dtype=bool) # samples still iterating
+        iterations = np.full(len(x), maxIter)
+        dX, dF = [], []
+        for iteration in range(1, maxIter+1):
+            residual = np.max(np.abs(f), axis=-1)
+            iterations[active & (residual < tolerance)] = iteration
+            active &= residual >= tolerance
+            if not np.any(active): break
+
+            step = damping * f
+            if len(dF) > 0:
+                DX = np.stack(dX, axis=-1) # (batch, neurons, memory)
+                DF = np.stack(dF, axis=-1)
+                DFt = np.swapaxes(DF, -1, -2)
+                A = DFt @ DF
+                A += 1e-12 * np.eye(len(dF)) * np.max(np.abs(A), axis=(-2,-1),
+                                                      keepdims=True)
+                A[~active] = np.eye(len(dF)) # converged samples are not updated
+                gamma = np.linalg.solve(A, DFt @ f[...,np.newaxis])
+                step -= ((DX + damping * DF) @ gamma)[...,0]
+            xNew = np.where(active[:,np.newaxis],
+                            np.maximum(x + step, 0), # activities are non-negative
+                            x)
+            fNew = np.where(active[:,np.newaxis], SteadyMap(xNew) - xNew, f)
+
+            dX.append(xNew - x)
+            dF.append(fNew - f)
+            if len(dF) > memory:
+                dX.pop(0)
+                dF.pop(0)
+            x, f = xNew, fNew
+        residual = np.max(np.abs(f), axis=-1)
+        converged = residual < tolerance
+
+        # Leave the layers in the solved state
+        for layer, shape, act in zip(layers, shapes, np.split(x, splits, axis=-1)):
+            layer.Act = act.reshape(shape).copy()
+        for layer in self.layers:
+            layer.FFFB.UpdateAct()
+            layer.GeRaw[:] = 0
+            layer.GiRaw[:] = 0
+            for mesh in layer.excMeshes + layer.inhMeshes:
+                mesh.resetActivity() # delta-sender restarts from this state
+
+        self.trialResiduals.extend(residual)
+        self.trialConverged.extend(converged)
+        iterations += warmupSteps
+
+        def FinishPhase():
+            for layer in self.layers:
+                #record phase activity at the end of each phase
+                layer.phaseHist[phaseName] = layer.getActivity().copy()
+
+                #Execute phasic processes (including XCAL)
+                for process in layer.phaseProcesses:
+                    if phaseName in process.phases or "all" in process.phases:
+                        process.StepPhase()
+
+        # Fall back to time stepping the samples which did not converge
+        self.solver = None
+        if not np.any(converged):
+            iterations += self.StepPhase(phaseName, **dataVectors)
+        elif not np.all(converged):
+            for rows, isSolved in [(converged, True), (~converged, False)]:
+                states = [layer.SplitBatch(rows) for layer in self.layers]
+                if isSolved:
+                    FinishPhase()
+                else:
+                    iterations[rows] += self.StepPhase(
+                        phaseName, **{key: value[rows] for key, value
+                                      in dataVectors.items()})
+                for layer, state in zip(self.layers, states):
+                    layer.JoinBatch(state, rows)
+            for layer in self.layers:
+                layer.phaseHist[phaseName] = layer.getActivity().copy()
+        else:
+            FinishPhase()
+        self.solver = solver
+
+        return iterations if isBatched else iterations[0]
+
+    def StepTrial(self, runType: str, debugData = {}, batchComplete = True,
+                  **dataVectors):
+        '''Runs each phase of a trial. When learning, the weight changes are
+            accumulated until `batchComplete` is True. Returns the number of
+            time steps used by the trial (per sample if batched phases are
+            solved for their steady state, see SolvePhase).
+        '''
         Train = runType=="Learn"
         for layer in self.layers:
             layer.InitTrial(Train)
             
+        numCycles = 0
         for phaseName in self.runConfig[runType]:
-            self.StepPhase(phaseName, debugData=debugData, **dataVectors)
+            numCycles += self.StepPhase(phaseName, debugData=debugData,
+                                        **dataVectors)
 
             # Store layer activity for each output layer during output phases
             if self.phaseConfig[phaseName]["isOutput"]:
                 for dataName, layer in self.layerDict["outputLayers"].items():
                     # TODO use pre-allocated numpy array to speed up execution
-                    self.outputs[dataName].append(layer.getActivity())
+                    activity = layer.getActivity().copy()
+                    if activity.ndim > 1: # one row per batched sample
+                        self.outputs[dataName].extend(activity)
+                    else:
+                        self.outputs[dataName].append(activity)
 
             if self.phaseConfig[phaseName]["isLearn"] and Train:
-                for layer in self.layers:
-                    dwtLog = debugData["dwtLog"] if "dwtLog" in debugData else None
-                    layer.Learn(dwtLog=dwtLog)
+                dwtLog = debugData["dwtLog"] if "dwtLog" in debugData else None
+                self.UpdateMeshes(batchComplete=batchComplete, dwtLog=dwtLog)
+
+        return numCycles
 
     def RunEpoch(self,
                  runType: str,
@@ -437,6 +828,7 @@ class Net:
                  reset: bool = False,
                  shuffle: bool = False,
                  debugData = {},
+                 batchSize: int = None,
                  **dataset: dict[str, np.ndarray]):
         '''Runs an epoch (iteration through all samples of a dataset) using a
             specified run type mathing a key from self.runConfig.
@@ -444,14 +836,29 @@ class Net:
                 - verbosity: specifies how much is printed to the console
                 - reset: specifies if layer activity is returned to zero each epoch
                 - shuffle: determines if the dataset is shuffled each epoch
+                - batchSize: when learning, the number of samples whose
+                    weight changes are averaged into a single update,
+                    otherwise samples are simulated in lockstep batches of
+                    this size (see RunBatches)
         '''
         numSamples = self.ValidateDataset(**dataset)
+        Train = runType=="Learn"
 
         # TODO use pre-allocated numpy array to speed up execution
         self.outputs = {key: [] for key in self.runConfig["outputLayers"]}
+        self.trialCycles = []
+        self.trialResiduals = []
+        self.trialConverged = []
 
         # suffle indices if necessary
         sampleIndices = np.random.permutation(numSamples) if shuffle else range(numSamples)
+
+        if batchSize is not None and not Train:
+            self.RunBatches(runType, sampleIndices, batchSize, verbosity, reset,
+                            **dataset)
+            self.RecordTrialStats(runType)
+            return numSamples
+        batchSize = 1 if batchSize is None else batchSize
         
         # TODO: find a faster way to iterate through datasets
         for sampleCount, sampleIndex in enumerate(sampleIndices):
@@ -460,31 +867,116 @@ class Net:
                       f"sample: ({sampleCount+1}/{numSamples}), ", end=""#"\r"
                       )
 
+            # apply accumulated weight changes at the end of each batch
+            batchComplete = ((sampleCount+1) % batchSize == 0 or
+                             sampleCount+1 == numSamples)
+
             dataVectors = {key:value[sampleIndex] for key, value in dataset.items()}
-            self.StepTrial(runType, debugData=debugData, **dataVectors)
+            numCycles = self.StepTrial(runType, debugData=debugData,
+                                       batchComplete=batchComplete, **dataVectors)
+            self.trialCycles.append(numCycles)
 
             if reset : self.resetActivity()
 
+        for layer in self.layers:
+            layer.FlushMonitors()
+        self.RecordTrialStats(runType)
         return numSamples
 
-    
+    def RecordTrialStats(self, runType: str):
+        '''Stores the number of time steps of each trial in the epoch under
+            results["cycles"] if any phase of the run type may end early, and
+            the solver residuals and convergence when solving for the steady
+            state (see SolvePhase).
+        '''
+        if self.solver is not None:
+            self.results.setdefault("iterations", []).append(np.array(self.trialCycles))
+            self.results.setdefault("residual", []).append(np.array(self.trialResiduals))
+            self.results.setdefault("converged", []).append(np.array(self.trialConverged))
+            return
+        if all(self.phaseConfig[phaseName].get("Settle") is None
+               for phaseName in self.runConfig[runType]):
+            return
+        cycles = self.results.setdefault("cycles", [])
+        cycles.append(np.array(self.trialCycles))
+
+    def RunBatches(self,
+                   runType: str,
+                   sampleIndices,
+                   batchSize: int,
+                   verbosity = 1,
+                   reset: bool = False,
+                   **dataset: dict[str, np.ndarray]):
+        '''Simulates the samples in lockstep batches of `batchSize` samples.
+            Every layer state (conductances, activity, averages, inhibition,
+            and the delta-sender state of the meshes) carries a leading batch
+            dimension and the meshes are applied as (B, n) @ W.T products.
+
+            Every sample in a batch starts from the state of the net at the
+            start of the batch, so this reproduces the sample-by-sample path
+            with `reset=True` whenever the net starts from a reset state.
+            Without a reset, each sample would instead start from the state
+            left by the previous sample, so batching requires `reset=True`.
+            Only run types without learning can be batched.
+        '''
+        if runType == "Learn":
+            raise ValueError("Batched trials are only supported for run types "
+                             "without learning.")
+        if not reset:
+            raise ValueError("Batched trials require reset=True, since every "
+                             "sample in a batch starts from the same state.")
+        if batchSize < 1:
+            raise ValueError(f"batchSize must be positive, got {batchSize}")
+
+        sampleIndices = np.asarray(sampleIndices)
+        numSamples = len(sampleIndices)
+        dataset = {key: np.asarray(value) for key, value in dataset.items()}
+
+        monitoring = self.monitoring
+        self.monitoring = False # monitors only display a single sample
+        for batchStart in range(0, numSamples, batchSize):
+            batchIndices = sampleIndices[batchStart:batchStart+batchSize]
+            if verbosity > 0:
+                print(f"\rEpoch: {self.epochIndex}, "
+                      f"sample: ({batchStart+len(batchIndices)}/{numSamples}), ", end=""
+                      )
+
+            for layer in self.layers:
+                layer.InitBatch(len(batchIndices))
+
+            dataVectors = {key:value[batchIndices] for key, value in dataset.items()}
+            numCycles = self.StepTrial(runType, **dataVectors)
+            self.trialCycles.extend(np.broadcast_to(numCycles, len(batchIndices)))
+
+            # keep the state of the last sample in the batch
+            for layer in self.layers:
+                layer.EndBatch()
+
+            if reset : self.resetActivity()
+        self.monitoring = monitoring
+
     def Learn(self,
               numEpochs = 50,
               verbosity = 1,
               reset: bool = True,
               shuffle: bool = True,
-              batchSize = 1, # TODO: Implement batch training (average delta weights over some number of training examples)
+              batchSize = 1, # average delta weights over some number of training examples
               repeat=1, # TODO: Implement repeated sample training (train muliple times for a single input sample before moving on to the next one)
               EvaluateFirst = True,
               debugData = {},
+              profile: bool = False,
               **dataset: dict[str, np.ndarray]) -> dict[str: list]:
         '''Training loop that runs a specified number of epochs.
 
                 - verbosity: specifies how much is printed to the console
                 - reset: specifies if layer activity is returned to zero each epoch
                 - shuffle: determines if the dataset is shuffled each epoch
-                - batchSize: (NOT IMPLEMENTED)
+                - batchSize: number of samples whose weight changes are
+                    averaged into a single update of each mesh
                 - repeat: (NOT IMPLEMENTED)
+                - profile: if True, the hot stages of the training epochs
+                    are timed and (results, timing report) is returned (see
+                    Profiler.Report). The profiler is kept in self.profiler
 
         '''
         if EvaluateFirst:
@@ -498,34 +990,59 @@ class Net:
 
             self.time = 0 #TODO: allow choice to reset the timer?
             
+        if profile:
+            self.profiler = Profiler()
+            self.profiler.Attach(self)
+
         # Training loop
         print(f"Begin training [{self.name}]...")
-        for epochIndex in range(numEpochs):
-            self.epochIndex = int(EvaluateFirst) + epochIndex
-            numSamples = self.RunEpoch("Learn", verbosity, reset, shuffle,
-                                       debugData=debugData, **dataset)
-            isFinished = self.EvaluateMetrics(**dataset)
-            if verbosity > 0:
-                primaryMetric = [key for key in self.runConfig["metrics"]][0]
-                print(f"\rEpoch: {self.epochIndex}, "
-                      f"sample: ({numSamples}/{numSamples}), "
-                      f" metric[{primaryMetric}]"
-                      f" = {self.results[primaryMetric][-1]}")
-                
-            if isFinished:
-                break
+        try:
+            for epochIndex in range(numEpochs):
+                self.epochIndex = int(EvaluateFirst) + epochIndex
+                numSamples = self.RunEpoch("Learn", verbosity, reset, shuffle,
+                                           debugData=debugData,
+                                           batchSize=batchSize, **dataset)
+                isFinished = self.EvaluateMetrics(**dataset)
+                if verbosity > 0:
+                    primaryMetric = [key for key in self.runConfig["metrics"]][0]
+                    print(f"\rEpoch: {self.epochIndex}, "
+                          f"sample: ({numSamples}/{numSamples}), "
+                          f" metric[{primaryMetric}]"
+                          f" = {self.results[primaryMetric][-1]}")
+                    
+                if isFinished:
+                    break
+        finally:
+            if profile:
+                self.profiler.Detach()
                 
         print(f"Finished training [{self.name}]")
+        if profile:
+            return self.results, self.profiler.Report()
         return self.results
 
     def Evaluate(self,
               verbosity = 1,
               reset: bool = True,
               shuffle: bool = True,
+              batchSize: int = None,
+              solver: dict = None,
               **dataset: dict[str, np.ndarray]):
+        '''Evaluates the metrics on a dataset without training.
 
+                - batchSize: if given, samples are simulated in lockstep
+                    batches of this size (see RunBatches). Requires
+                    reset=True
+                - solver: if given, solves for the steady state of each
+                    phase instead of time stepping (see SolvePhase)
+        '''
         if verbosity > 0: print(f"Evaluating [{self.name}] without training...")
-        self.RunEpoch("Infer", verbosity, reset, shuffle, **dataset)
+        self.solver = solver
+        try:
+            self.RunEpoch("Infer", verbosity, reset, shuffle,
+                          batchSize=batchSize, **dataset)
+        finally:
+            self.solver = None
         self.EvaluateMetrics(**dataset)
         if verbosity > 0:
             primaryMetric = [key for key in self.runConfig["metrics"]][0]
@@ -537,13 +1054,40 @@ class Net:
     
     def Infer(self,
               verbosity = 1,
-              reset: bool = False,
+              reset: bool = None,
+              batchSize: int = None,
+              solver: dict = None,
               **dataset: dict[str, np.ndarray]):
         '''Applies the network to a given dataset and returns each output
+
+                - reset: whether to reset the activity before each sample.
+                    Defaults to True when batching and False otherwise
+                - batchSize: if given, samples are simulated in lockstep
+                    batches of this size (see RunBatches). Requires
+                    reset=True (an explicit reset=False raises a ValueError),
+                    since the samples of a batch can not start from the
+                    state left by the previous sample
+                - solver: if given, solves for the steady state of each
+                    phase instead of time stepping (see SolvePhase). The
+                    iterations and residual of each sample are stored in
+                    self.results
         '''
         if verbosity > 0: print(f"Inferring [{self.name}]...")
-        self.RunEpoch("Infer", verbosity, reset, shuffle= False, **dataset)
+        if reset is None:
+            reset = batchSize is not None
+        self.solver = solver
+        try:
+            self.RunEpoch("Infer", verbosity, reset, shuffle= False,
+                          batchSize=batchSize, **dataset)
+        finally:
+            self.solver = None
             
+        if verbosity > 0 and solver is not None:
+            print(f"\nSteady state: mean iterations = "
+                  f"{np.mean(self.results['iterations'][-1]):0.1f}, max residual = "
+                  f"{np.max(self.results['residual'][-1]):0.2e}, converged "
+                  f"{np.sum(self.results['converged'][-1])}"
+                  f"/{len(self.results['converged'][-1])}")
         if verbosity > 0: print(f"Inference complete.")
         return self.outputs
 
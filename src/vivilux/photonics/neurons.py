@@ -9,7 +9,12 @@
         Express 30, 19360-19389 (2022)
 '''
 from os import path
+import hashlib
+import json
+import os
 import pathlib
+import tempfile
+import types
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from typing import callable
@@ -17,10 +22,93 @@ if TYPE_CHECKING:
 from ..activations import NoisyXX1
 
 import numpy as np
-from scipy.optimize import curve_fit
+
+# Directory of the on-disk cache of fitted parameters (see FitScaling)
+CACHE_DIR = os.environ.get("VIVILUX_CACHE",
+                           path.join(path.expanduser("~"), ".cache", "vivilux"))
+
+def _describe(value, depth: int = 0) -> str:
+    '''Describes a value referenced by a scaling function for FitKey.
+        Functions are described by their code and the values they reference
+        (up to a depth of 3), and objects by their attributes.
+    '''
+    if depth > 3:
+        return type(value).__qualname__
+    if isinstance(value, (types.ModuleType, type)):
+        return value.__name__
+    if isinstance(value, types.FunctionType):
+        code = value.__code__
+        referenced = [value.__globals__.get(name) for name in code.co_names
+                      if name in value.__globals__]
+        closure = [cell.cell_contents for cell in value.__closure__ or []]
+        return "|".join([code.co_code.hex(), repr(code.co_consts),
+                         repr(code.co_names), repr(value.__defaults__),
+                         *[_describe(item, depth+1)
+                           for item in referenced + closure]])
+    if isinstance(value, np.ndarray):
+        return hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()
+    if hasattr(value, "__dict__"):
+        return type(value).__qualname__ + repr(
+            [(name, _describe(item, depth+1))
+             for name, item in sorted(vars(value).items())])
+    return repr(value)
+
+def FitKey(scaleFn: callable, power: np.ndarray, rate: np.ndarray,
+           p0 = None) -> str:
+    '''Returns a hash identifying the fit of `scaleFn` to the measured
+        (power, rate) data starting from p0. The scaling function enters the
+        hash through its code and the values it references (e.g. the
+        parameters of its activation function), so changing any of them
+        invalidates cached fits.
+    '''
+    digest = hashlib.sha256()
+    for data in [power, rate]:
+        data = np.ascontiguousarray(data, dtype=np.float64)
+        digest.update(repr(data.shape).encode())
+        digest.update(data.tobytes())
+    digest.update(repr(None if p0 is None else
+                       [float(param) for param in p0]).encode())
+    digest.update(_describe(scaleFn).encode())
+    return digest.hexdigest()
+
+def FitScaling(scaleFn: callable, power: np.ndarray, rate: np.ndarray,
+               p0 = None, cacheDir: str = CACHE_DIR) -> np.ndarray:
+    '''Fits `scaleFn` to the measured (power, rate) data with curve_fit
+        and returns the fitted parameters. Results are stored in `cacheDir`
+        under their FitKey and reused by later fits of the same data and
+        function, also across processes. Set cacheDir to None to always fit.
+    '''
+    if cacheDir is not None:
+        cacheFile = path.join(cacheDir, "neuronFits",
+                              FitKey(scaleFn, power, rate, p0) + ".json")
+        try:
+            with open(cacheFile) as file:
+                return np.array(json.load(file))
+        except (OSError, ValueError): # missing or unreadable entry
+            pass
+
+    from scipy.optimize import curve_fit
+    popt, _ = curve_fit(scaleFn, power, rate, p0=p0)
+
+    if cacheDir is not None:
+        try: # write atomically, other processes may read the entry
+            os.makedirs(path.dirname(cacheFile), exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", dir=path.dirname(cacheFile),
+                                             suffix=".tmp",
+                                             delete=False) as file:
+                json.dump(popt.tolist(), file)
+            os.replace(file.name, cacheFile)
+        except OSError: # cache is optional
+            pass
+    return popt
 
 
 class Neuron:
+    '''Scales rate-coded activity to the energy of a measured neuron. The
+        scaling function is fit to the measured (power, rate) data on first
+        use of `popt`, so defining a neuron model costs nothing until it is
+        used. Fits are cached on disk (see FitScaling).
+    '''
     def __init__(self,
                  scaleFn: callable,
                  power: np.ndarray,
@@ -31,7 +119,17 @@ class Neuron:
         self.scaleFn = scaleFn
         self.spikeEnergy = spikeEnergy
         self.spikeWidth = spikeWidth
-        self.popt, _ = curve_fit(scaleFn, power, rate, p0=p0)
+        self.fitData = (power, rate, p0)
+        self.fitParams = None
+
+    @property
+    def popt(self) -> np.ndarray:
+        '''Fitted parameters of the scaling function.
+        '''
+        if self.fitParams is None:
+            power, rate, p0 = self.fitData
+            self.fitParams = FitScaling(self.scaleFn, power, rate, p0)
+        return self.fitParams
     
     def __call__(self, rateCode):
         '''Scales the unitless rate-coded activity from leabra to real-world
@@ -4,10 +4,12 @@ from .utils import *
 from .devices import Device
 
 import numpy as np
-from scipy.stats import ortho_group
+
+import time
 
 class Unitary(Mesh):
     def __init__(self, *args, **kwargs):
+        from scipy.stats import ortho_group
         super().__init__(*args, **kwargs)
         self.set(ortho_group.rvs(len(self)))
 
@@ -15,6 +17,7 @@ class MZImesh(Mesh):
     '''Base class for a single rectangular MZI used in incoherent mode.
     '''
     NAME = "Rect_MZI"
+    hasDecomposition = True # set() can compute the params from the matrix
     def __init__(self,
                  size: int,
                  inLayer: Layer,
@@ -41,6 +44,11 @@ class MZImesh(Mesh):
                  atol = 0, # absolute tolerance
                  rtol = 1e-2, # relative tolerance
                  bitPrecision = None,
+                 deltaMethod = "LAMM", # "LAMM" (random directional derivatives) or "LM" (Levenberg-Marquardt on the analytic jacobian)
+                 lstsqRcond = 1e-7, # relative singular value cutoff in the LAMM least squares
+                 lstsqDamping = 0, # Tikhonov damping of the LAMM least squares
+                 warmStart = False, # keep the (Broyden updated) LAMM derivatives and step size between ApplyDelta calls
+                 wavelengthView = False, # keep the per-wavelength output powers in applyTo
                  **kwargs):
         super().__init__(size,inLayer,AbsScale,RelScale,InitMean,InitVar,Off,
                          Gain,dtype,wbOn,wbAvgThr,wbHiThr,wbHiGain,wbLoThr,
@@ -57,10 +65,23 @@ class MZImesh(Mesh):
         self.linMatrix = np.pad(self.linMatrix, ((0,size-shape1[0]),(0, size-shape1[1])))
         shape2 = self.matrix.shape
         self.matrix = np.pad(self.matrix, ((0,size-shape2[0]),(0, size-shape2[1])))
+
+        if deltaMethod not in ["LAMM", "LM"]:
+            raise ValueError(f"Unknown deltaMethod: {deltaMethod}")
+        self.deltaMethod = deltaMethod
+        self.lmDamping = 1e-3 # initial Levenberg-Marquardt damping
+        self.lstsqRcond = lstsqRcond
+        self.lstsqDamping = lstsqDamping
+        self.warmStart = warmStart
+        self.lammState = None # (derivative estimate, coeff) kept between calls
+        self.numProbes = 0 # counts matrices evaluated for directional derivatives
+        self.wavelengthView = wavelengthView
+        self.wavelengthPowers = None # (outputs, wavelengths) of the last applyTo
         
         self.numUnits = int(self.size*(self.size-1)/2)
         self.bitPrecision = bitPrecision
         self.bitMask = int(2**bitPrecision - 1) if bitPrecision is not None else None
+        self.rectCaches = {} # stage products of each rectangular mesh (see rectMatrix)
         self.Initialize()
         numParams = np.concatenate([param.flatten() for param in self.getParams()]).size
         # arbitrary guess for how many directions are needed
@@ -94,18 +115,18 @@ class MZImesh(Mesh):
 
         self.concavity = 1.5
 
-    def DeviceHold(self):
+    def DeviceHold(self, numSamples: int = 1):
         '''Calls the hold function for each device in the mesh according
             to the current parameters.
 
             This function should be overwritten for meshses with different
             parameter structures.
         '''
-        DT = self.inLayer.net.DELTA_TIME
+        DT = numSamples * self.inLayer.net.DELTA_TIME
         params = self.getParams()
         self.holdEnergy += self.device.Hold(params, DT)
 
-        self.holdIntegration += np.sum(params)
+        self.holdIntegration += numSamples * np.sum(params)
         self.holdTime += DT
 
 
@@ -124,7 +145,8 @@ class MZImesh(Mesh):
         self.resetIntegration += np.sum(updatedParams)
 
     def getFromParams(self, params = None):
-        '''Function generates matrix from a list of params.
+        '''Function generates matrix from a list of params. Params stacked
+            along a leading axis return a stack of matrices.
 
             This function should be overwritten for meshes with different
             parameter structures.
@@ -132,18 +154,94 @@ class MZImesh(Mesh):
         params = self.getParams() if params is None else params
         self.boundParams(params)
         self.ApplyBitPrecision(params)
-        complexMat = psToRect(params[0], self.size)
+        complexMat = self.rectMatrix(0, params[0])
         return np.square(np.abs(complexMat))
+
+    def rectMatrix(self, index: int, phaseShifters: np.ndarray) -> np.ndarray:
+        '''Returns psToRect(phaseShifters, self.size) for the rectangular
+            mesh whose current phase shifters are self.getParams()[index].
+            When only a few of its units are changed, the cached prefix and
+            suffix products of the current mesh are used to recompute only
+            the affected stages (see psToRectUpdate).
+        '''
+        current = self.getParams()[index]
+        if phaseShifters.ndim > 2 or phaseShifters is current:
+            return psToRect(phaseShifters, self.size)
+        if index not in self.rectCaches:
+            cached, products = current, None
+        else:
+            cached, products = self.rectCaches[index]
+        changed = np.flatnonzero(np.any(phaseShifters != cached, axis=1))
+        if len(changed) > self.size: # dense change, rebuild the mesh
+            return psToRect(phaseShifters, self.size)
+
+        if products is None:
+            cached = current.copy()
+            products = rectProducts(cached, self.size)
+            self.rectCaches[index] = (cached, products)
+        return psToRectUpdate(phaseShifters, self.size, products, changed)
+
+    def ClearCache(self, params: list[np.ndarray] = None):
+        '''Clears the cached stage products of the rectangular meshes. If
+            params are given, the cache is only cleared when they are the
+            current params of the mesh (which are then modified in place).
+        '''
+        if params is None or any(param is current for param, current in
+                                 zip(params, self.getParams())):
+            self.rectCaches = {}
     
-    def set(self, matrix, verbose=False):
+    def set(self, matrix, verbose=False, refine=False):
         '''Function used to directly set the matrix implemented by the mesh
-            without knowledge of the parameters needed. 
+            without knowledge of the parameters needed. The params are
+            calculated from the matrix (see Decompose), and the remaining
+            delta is optionally implemented with ApplyDelta (refine=True).
+
+            Meshes without a decomposition of the matrix into their params
+            (hasDecomposition = False, e.g. hardware meshes) implement the
+            matrix with ApplyDelta instead, returning its result.
+
+            Returns the magnitude of the remaining delta and the number of
+            ApplyDelta steps.
         '''
         self.modified = True
-        delta = matrix - self.matrix
-        return self.ApplyDelta(delta=delta, verbose=verbose)
+        self.WeightsChanged()
+        target = self.get()/self.Gscale
+        if not self.hasDecomposition:
+            delta = matrix - target[:matrix.shape[0], :matrix.shape[1]]
+            return self.ApplyDelta(delta=delta, verbose=verbose)
+        initDeltaMagnitude = Magnitude(matrix - target[:matrix.shape[0], :matrix.shape[1]])
+        target[:matrix.shape[0], :matrix.shape[1]] = matrix
+
+        self.setParams(self.Decompose(target))
+        self.setFromParams()
+        self.lammState = None # derivatives are not valid for the new params
+        delta = target - self.matrix
+        if refine:
+            return self.ApplyDelta(delta=delta, verbose=verbose)
+
+        deltaMagnitude = Magnitude(delta)
+        self.record = np.array([initDeltaMagnitude, deltaMagnitude])
+        if verbose:
+            print(f"Initial delta magnitude: {initDeltaMagnitude}, "
+                  f"after decomposition: {deltaMagnitude}")
+        return deltaMagnitude, 0
+
+    def Decompose(self, matrix) -> list[np.ndarray]:
+        '''Calculates the params which implement the matrix (or its nearest
+            achievable approximation). A unitary with the matrix as its power
+            matrix is found, decomposed into the phase shifters of the
+            rectangular mesh and refined, restarting from random phases
+            (drawn from self.rng) until the matrix is reproduced (see
+            rectDecomposePower).
+
+            This function should be overwritten for meshes with different
+            parameter structures.
+        '''
+        current = psToRect(self.phaseShifters, self.size)
+        phaseShifters, _ = rectDecomposePower(matrix, current, rng=self.rng)
+        return [phaseShifters]
     
-    def get(self):
+    def getEffective(self):
         '''Returns the current matrix representation multiplied by the Gscale.
             This function is generic to any photonic mesh and should not be
             overwritten.
@@ -171,7 +269,9 @@ class MZImesh(Mesh):
         
         self.DeviceUpdate(params)
         self.phaseShifters = params[0]
+        self.ClearCache()
         self.modified = True
+        self.WeightsChanged()
     
     def reshapeParams(self, flatParams):
         '''Reshapes a flattened set of parameters to list format
@@ -190,6 +290,7 @@ class MZImesh(Mesh):
             are passed by reference and changes are reflected outside the
             function.
         '''
+        self.ClearCache(params)
         params[0] = BoundTheta(params[0])
 
         return params
@@ -197,21 +298,35 @@ class MZImesh(Mesh):
     def applyTo(self, data):
         '''Applies the mesh matrix according to how it should physically be
             interpretted. In this case, signals on each waveguide should be
-            incoherent with one another, so they are split into separate
-            channels and then summed together.
+            incoherent with one another, so the output powers of each
+            wavelength (input channel) sum linearly and the power matrix acts
+            as a plain matrix-vector product.
+
+            With wavelengthView, the power contributed by each wavelength to
+            each output is also stored in wavelengthPowers (one column per
+            wavelength) for single samples.
             
             This function should be overwritten for other meshes where the
             matrix is not interpreteted the same way.
         '''
-        # Split data into diagonal matrix where cols represent wavelength
-        # TODO: Check for slowdown because of reshaping in super().applyTo()
-        self.DeviceHold()
-        matrixData = Diagonalize(data)
-        dataShape = matrixData.shape
-        result = super().applyTo(matrixData)
-        result = result.reshape(self.shape[0], dataShape[1])
-        ## Take the sum across each wavelength
-        return np.sum(result, axis=1)
+        self.DeviceHold(len(data) if data.ndim > 1 else 1)
+        synapticWeights = self.get()[:self.shape[0], :self.shape[1]]
+        data = data[...,:self.shape[1]]
+
+        if self.wavelengthView and data.ndim == 1:
+            self.wavelengthPowers = synapticWeights * data
+            ## Take the sum across each wavelength
+            return np.sum(self.wavelengthPowers, axis=1)
+        if data.ndim > 1: # batched samples, stacked like Mesh.applyTo
+            return (synapticWeights @ data[...,np.newaxis])[...,0]
+        return synapticWeights @ data
+
+    def applyChanged(self, delta, changed):
+        '''Incoherent signals sum linearly across wavelengths, so only the
+            changed channels need to be propagated.
+        '''
+        self.DeviceHold(len(delta) if delta.ndim > 1 else 1)
+        return super().applyChanged(delta, changed)
     
     def ApplyUpdate(self, delta, m, n):
         '''Applies the delta vector to the linear weights and calculates the 
@@ -246,19 +361,25 @@ class MZImesh(Mesh):
             Updates self.matrix and returns the difference vector between target
             and implemented delta.
         '''
+        if self.deltaMethod == "LM":
+            return self.ApplyDeltaLM(delta, verbose=verbose)
+
         # Make column vectors for deltas and theta
         m, n = delta.shape # presynaptic, postsynaptic array lengths
         deltaFlat = delta.flatten().reshape(-1,1)
-        thetaFlat = np.concatenate([param.flatten() for param in self.getParams()]).reshape(-1,1)
 
         initDeltaMagnitude = np.sqrt(np.sum(np.square(deltaFlat)))
         deltaMagnitude = initDeltaMagnitude
         updateMagnitude = self.updateMagnitude # save update magnitude
         self.record = -np.ones(self.numSteps+1)
         self.record[0] = initDeltaMagnitude
+        self.solveRecord = {"time": [], "rank": [], "condition": []}
         tol = self.atol + self.rtol * initDeltaMagnitude
         errorTol = np.sqrt(tol/self.concavity)
         coeff = 1
+        estimate = None # directional derivatives (X, V) at the current params
+        if self.warmStart and self.lammState is not None:
+            estimate, coeff = self.lammState
         skipCount = 0
         overflow = True
         if verbose:
@@ -266,32 +387,29 @@ class MZImesh(Mesh):
 
         for step in range(self.numSteps):
             currMat = self.get()/self.Gscale
-            X = np.zeros((deltaFlat.shape[0], self.numDirections))
-            V = np.zeros((thetaFlat.shape[0], self.numDirections))
-            
-            # Calculate directional derivatives
-            for i in range(self.numDirections):
-                tempx, tempv= self.matrixGradient()
-                tempv = np.concatenate([param.flatten() for param in tempv])
-                X[:,i], V[:,i] = tempx[:n, :m].flatten(), tempv.flatten()
+            probed = estimate is None
+            if probed: # Calculate directional derivatives (one per column)
+                derivatives, stepVectors = self.matrixGradients(self.numDirections)
+                X = derivatives[:, :n, :m].reshape(self.numDirections, -1).T
+                V = np.concatenate([stepVector.reshape(self.numDirections, -1)
+                                    for stepVector in stepVectors], axis=1).T
+                self.numProbes += 2 * self.numDirections
+            else:
+                X, V = estimate
+            estimate = None
 
             # Solve least square regression for update
-            for iteration in range(self.numDirections):
-                xtx = X.T @ X
-                rank = np.linalg.matrix_rank(xtx)
-                if rank == len(xtx): # matrix will have an inverse
-                    a = np.linalg.inv(xtx) @ X.T @ deltaFlat
-                    assert(np.any(np.isnan(a))==False)
-                    break
-                elif rank == 0:
-                    self.updateMagnitude *= 1.2
-                    self.record[step+1] = -np.inf
-                else: # direction vectors cary redundant information use one less
-                    X = X[:,:-1]
-                    V = V[:,:-1]
-                    continue
-            if rank == 0: 
+            start = time.perf_counter()
+            a, rank, condition = LeastSquares(X, deltaFlat, self.lstsqRcond,
+                                              self.lstsqDamping)
+            self.solveRecord["time"].append(time.perf_counter() - start)
+            self.solveRecord["rank"].append(rank)
+            self.solveRecord["condition"].append(condition)
+            if rank == 0:
+                self.updateMagnitude *= 1.2
+                self.record[step+1] = -np.inf
                 continue
+            assert(np.any(np.isnan(a))==False)
             
             # bound max step in `a`
             a *= coeff
@@ -309,11 +427,14 @@ class MZImesh(Mesh):
             stepCoeff = newMagnitude/deltaMagnitude
             
             # update step scaling
-            if (stepCoeff > 1):
+            if (stepCoeff > 1 and not probed): # stale estimate, probe again
+                self.record[step+1] = -100
+                continue
+            elif (stepCoeff > 1):
                 coeff *= 0.9
                 skipCount += 1
                 if skipCount > 25: # take a random big step
-                    randomParams = [3e-1*2*(np.random.rand(*param.shape)-0.5)+
+                    randomParams = [3e-1*2*(self.rng.rand(*param.shape)-0.5)+
                                     param for param in self.getParams()]
                     newMat = self.getFromParams(randomParams)
                     trueDelta = newMat - currMat
@@ -336,6 +457,11 @@ class MZImesh(Mesh):
 
             # Apply update to parameters
             self.setParams(updatedParams)
+            if self.warmStart: # Broyden update of the directional derivatives
+                paramStep = linearCombination
+                X = X + ((trueDelta - X @ a) @ (paramStep.T @ V) /
+                         (paramStep.T @ paramStep))
+                estimate = (X, V)
             deltaFlat -= trueDelta
             deltaMagnitude = Magnitude(deltaFlat)
             self.record[step+1] = deltaMagnitude
@@ -349,11 +475,100 @@ class MZImesh(Mesh):
         
         self.numOverflows += int(overflow) # always increments except when exceeding tol
 
-        self.updateMagnitude = updateMagnitude # restore original magnitude
+        if self.warmStart: # keep derivatives and step size for the next call
+            self.lammState = (estimate, coeff)
+        else:
+            self.updateMagnitude = updateMagnitude # restore original magnitude
 
         self.setFromParams()
         return deltaMagnitude, step
         
+    def ApplyDeltaLM(self, delta:np.ndarray, verbose=False):
+        '''Finds the set of params which implements some change in weights
+            for the matrix using Levenberg-Marquardt iterations on the exact
+            jacobian of the mesh. Rejected steps increase the damping, and
+            the iteration stops early once the damping grows so large that
+            the remaining delta is not reachable by the mesh.
+
+            Updates self.matrix and returns the magnitude of the difference
+            between target and implemented delta and the number of steps.
+        '''
+        m, n = delta.shape # presynaptic, postsynaptic array lengths
+        deltaFlat = delta.flatten()
+
+        initDeltaMagnitude = Magnitude(deltaFlat)
+        deltaMagnitude = initDeltaMagnitude
+        self.record = -np.ones(self.numSteps+1)
+        self.record[0] = initDeltaMagnitude
+        tol = self.atol + self.rtol * initDeltaMagnitude
+        damping = self.lmDamping
+        overflow = True
+        if verbose:
+            print(f"Initial delta magnitude: {initDeltaMagnitude}")
+
+        currMat = self.get()/self.Gscale
+        jac = None
+        for step in range(self.numSteps):
+            if jac is None: # only recalculate after an accepted step
+                jac = self.jacobian()[:m, :n].reshape(m*n, -1)
+                jtj = jac.T @ jac
+                jtr = jac.T @ deltaFlat
+                # Marquardt scaling (with a floor for insensitive params)
+                scaling = np.diag(jtj) + 1e-9 * np.max(np.diag(jtj))
+
+            flatStep = np.linalg.solve(jtj + damping*np.diag(scaling), jtr)
+            updatedParams = [param + opt for param, opt in 
+                             zip(self.getParams(), self.reshapeParams(flatStep))]
+            self.boundParams(updatedParams)
+
+            # test delta after step
+            newMat = self.getFromParams(updatedParams)
+            trueDelta = (newMat - currMat)[:m, :n].flatten()
+            newMagnitude = Magnitude(deltaFlat - trueDelta)
+
+            if newMagnitude >= deltaMagnitude: # reject step
+                damping *= 4
+                self.record[step+1] = -100
+                if damping > 1e8: # delta cannot be implemented any further
+                    break
+                continue
+            damping = max(damping/3, 1e-12)
+
+            # Apply update to parameters
+            self.setParams(updatedParams)
+            currMat = newMat
+            deltaFlat -= trueDelta
+            deltaMagnitude = newMagnitude
+            self.record[step+1] = deltaMagnitude
+            jac = None
+            if deltaMagnitude < tol:
+                if verbose:
+                    print(f"Break after {step+1} steps, delta magnitude: {deltaMagnitude}")
+                overflow = False
+                break
+        if verbose:
+            print(f"Final delta magnitude: {deltaMagnitude}, success: {initDeltaMagnitude > deltaMagnitude}")
+
+        self.numOverflows += int(overflow) # always increments except when exceeding tol
+
+        self.setFromParams()
+        return deltaMagnitude, step
+
+    def jacobian(self, params = None) -> np.ndarray:
+        '''Calculates the exact derivatives of the matrix with respect to
+            each of the params, ordered as the flattened params (see
+            reshapeParams). Uses d|U|^2 = 2 Re(conj(U) dU).
+
+            Returns an array with shape (size, size, numParams).
+
+            This function should be overwritten for meshes with different
+            parameter structures.
+        '''
+        params = self.getParams() if params is None else params
+        complexMat, derivatives = psToRectJacobian(params[0], self.size)
+        jac = 2 * np.real(np.conj(complexMat) * derivatives)
+        return np.moveaxis(jac.reshape(-1, self.size, self.size), 0, -1)
+
     def matrixGradient(self, stepVector: list[np.ndarray] = None):
         '''Calculates the gradient of the matrix with respect to the phase
             shifters in the MZI mesh. This gradient is with respect to the
@@ -364,7 +579,7 @@ class MZImesh(Mesh):
         paramsList = self.getParams()
         # create a random step vector and set magnitude to self.updateMagnitude
         if stepVector is None:
-            stepVectors = [2*np.random.rand(*param.shape)-1 for param in paramsList] # TODO: determine which range is better [0,1) or [-1,1)
+            stepVectors = [2*self.rng.rand(*param.shape)-1 for param in paramsList] # TODO: determine which range is better [0,1) or [-1,1)
             flatVectors = [stepVector.flatten() for stepVector in stepVectors]
             randMagnitude = Magnitude(np.concatenate(flatVectors))
             stepVectors = [stepVector/randMagnitude for stepVector in stepVectors]
@@ -387,6 +602,40 @@ class MZImesh(Mesh):
         derivativeMatrix = (plusMatrix-minusMatrix)/self.updateMagnitude
 
         return derivativeMatrix, stepVectors
+
+    def matrixGradients(self, numDirections: int):
+        '''Calculates the directional derivatives of the matrix along
+            numDirections random step vectors at once. The forward and
+            backward steps of all directions are stacked along a leading
+            axis of the params and evaluated in a single call to
+            getFromParams.
+
+            Returns derivativeMatrices (numDirections, size, size) and the
+            list of stepVectors, each with a leading numDirections axis.
+        '''
+        paramsList = self.getParams()
+        # create random step vectors with magnitude self.updateMagnitude
+        stepVectors = [2*self.rng.rand(numDirections, *param.shape)-1
+                       for param in paramsList]
+        randMagnitude = np.sqrt(sum(
+            np.sum(np.square(stepVector.reshape(numDirections, -1)), axis=1)
+            for stepVector in stepVectors))
+        stepVectors = [stepVector * (self.updateMagnitude / randMagnitude
+                                     ).reshape(-1, *[1]*(stepVector.ndim-1))
+                       for stepVector in stepVectors]
+
+        # Forward steps followed by backward steps
+        stackedParams = [np.concatenate([param + stepVector,
+                                         param - stepVector])
+                         for param, stepVector in zip(paramsList, stepVectors)]
+        self.boundParams(stackedParams)
+        matrices = self.getFromParams(stackedParams)
+        plusMatrices = matrices[:numDirections]
+        minusMatrices = matrices[numDirections:]
+
+        derivativeMatrices = (plusMatrices-minusMatrices)/self.updateMagnitude
+
+        return derivativeMatrices, stepVectors
     
 
 # class CohMZIMesh(MZImesh):
@@ -430,13 +679,13 @@ class DiagMZI(MZImesh):
         self.setIntegration = 0
         self.resetIntegration = 0
 
-    def DeviceHold(self):
-        DT = self.inLayer.net.DELTA_TIME
+    def DeviceHold(self, numSamples: int = 1):
+        DT = numSamples * self.inLayer.net.DELTA_TIME
         currParams = self.getParams()
         self.holdEnergy += self.psDevice.Hold(currParams[:1], DT)
         # TODO implement SOA
 
-        self.holdIntegration += np.sum(currParams[:1])
+        self.holdIntegration += numSamples * np.sum(currParams[:1])
         self.holdTime += DT
 
     def DeviceUpdate(self, updatedParams):
@@ -459,10 +708,36 @@ class DiagMZI(MZImesh):
         '''
         params = self.getParams() if params is None else params
         self.boundParams(params)
-        complexMat = psToRect(params[0], self.size)
-        soaStage = Diagonalize(params[1])
-        return soaStage @ np.square(np.abs(complexMat))
+        complexMat = self.rectMatrix(0, params[0])
+        soaStage = params[1][..., :, None] # diagonal gain applied to each row
+        return soaStage * np.square(np.abs(complexMat))
     
+    def jacobian(self, params = None) -> np.ndarray:
+        '''Calculates the exact derivatives of the matrix with respect to
+            each of the params (see MZImesh.jacobian).
+        '''
+        params = self.getParams() if params is None else params
+        complexMat, derivatives = psToRectJacobian(params[0], self.size)
+        powerMat = np.square(np.abs(complexMat))
+        psJac = 2 * np.real(np.conj(complexMat) * derivatives)
+        psJac = params[1][:, None] * psJac.reshape(-1, self.size, self.size)
+        # each diagonal gain scales one row of the power matrix
+        soaJac = np.zeros((self.size, self.size, self.size))
+        soaJac[np.arange(self.size), np.arange(self.size)] = powerMat
+        return np.moveaxis(np.concatenate([psJac, soaJac]), 0, -1)
+
+    def Decompose(self, matrix) -> list[np.ndarray]:
+        '''Calculates the params which implement the matrix (or its nearest
+            achievable approximation). The gains are the row sums of the
+            matrix and the row-normalized matrix is implemented by the
+            rectangular mesh (see MZImesh.Decompose).
+        '''
+        gains = BoundGain(np.sum(np.maximum(matrix, 0), axis=1))
+        current = psToRect(self.phaseShifters, self.size)
+        phaseShifters, _ = rectDecomposePower(matrix / gains[:, None], current,
+                                              rng=self.rng)
+        return [phaseShifters, gains]
+
     def getParams(self):
         return [self.phaseShifters, self.diagonals]
     
@@ -474,10 +749,13 @@ class DiagMZI(MZImesh):
         
         self.phaseShifters = params[0]
         self.diagonals = params[1]
+        self.ClearCache()
 
         self.modified = True
+        self.WeightsChanged()
 
     def boundParams(self, params):
+        self.ClearCache(params)
         params[0] = BoundTheta(params[0])
         params[1] = BoundGain(params[1])
 
@@ -511,13 +789,13 @@ class SVDMZI(MZImesh):
         self.setIntegration = 0
         self.resetIntegration = 0
 
-    def DeviceHold(self):
-        DT = self.inLayer.net.DELTA_TIME
+    def DeviceHold(self, numSamples: int = 1):
+        DT = numSamples * self.inLayer.net.DELTA_TIME
         currParams = self.getParams()
         self.holdEnergy += self.psDevice.Hold(currParams[:1], DT)
         # TODO implement SOA
 
-        self.holdIntegration += np.sum(currParams[:1])
+        self.holdIntegration += numSamples * np.sum(currParams[:1])
         self.holdTime += DT
 
     def DeviceUpdate(self, updatedParams):
@@ -544,12 +822,49 @@ class SVDMZI(MZImesh):
         '''
         params = self.getParams() if params is None else params
         self.boundParams(params)
+        complexMat1 = self.rectMatrix(0, params[0])
+        soaStage = np.sqrt(params[1])[..., :, None] # diagonal applied to rows
+        complexMat2 = self.rectMatrix(2, params[2])
+        fullComplexMat = complexMat2 @ (soaStage * complexMat1)
+
+        return np.square(np.abs(fullComplexMat))
+
+    def jacobian(self, params = None) -> np.ndarray:
+        '''Calculates the exact derivatives of the matrix with respect to
+            each of the params (see MZImesh.jacobian).
+        '''
+        params = self.getParams() if params is None else params
         complexMat1 = psToRect(params[0], self.size)
-        soaStage = Diagonalize(params[1])
+        soaStage = np.sqrt(params[1])
         complexMat2 = psToRect(params[2], self.size)
-        fullComplexMat = complexMat2 @ np.sqrt(soaStage) @ complexMat1
 
-        return np.square(np.abs(fullComplexMat))
+        fullComplexMat, derivatives1 = psToRectJacobian(
+            params[0], self.size, left=complexMat2 * soaStage)
+        _, derivatives2 = psToRectJacobian(
+            params[2], self.size, right=soaStage[:, None] * complexMat1)
+        # each diagonal scales the outer product of a column and a row
+        soaDerivatives = (complexMat2.T[:, :, None] * complexMat1[:, None, :]
+                          / (2*soaStage[:, None, None]))
+
+        derivatives = np.concatenate([
+            derivatives1.reshape(-1, self.size, self.size),
+            soaDerivatives,
+            derivatives2.reshape(-1, self.size, self.size)])
+        jac = 2 * np.real(np.conj(fullComplexMat) * derivatives)
+        return np.moveaxis(jac, 0, -1)
+
+    def Decompose(self, matrix) -> list[np.ndarray]:
+        '''Calculates the params which implement the matrix in closed form.
+            The SVD of the amplitudes sqrt(matrix) = W diag(s) Vh gives the
+            unitaries of both rectangular meshes and the gains s^2. The
+            output phases of the decomposition of Vh commute with the gains
+            and are absorbed into W before it is decomposed.
+        '''
+        W, singularValues, Vh = np.linalg.svd(np.sqrt(np.maximum(matrix, 0)))
+        phaseShifters1, phases1 = rectDecompose(Vh)
+        phaseShifters2, _ = rectDecompose(W * phases1)
+        gains = BoundGain(np.square(singularValues))
+        return [phaseShifters1, gains, phaseShifters2]
 
     def getParams(self):
         return [self.phaseShifters1, self.diagonals, self.phaseShifters2]
@@ -563,10 +878,13 @@ class SVDMZI(MZImesh):
         self.phaseShifters1 = params[0]
         self.diagonals = params[1]
         self.phaseShifters2 = params[2]
+        self.ClearCache()
 
         self.modified = True
+        self.WeightsChanged()
 
     def boundParams(self, params):
+        self.ClearCache(params)
         params[0] = BoundTheta(params[0])
         params[1] = BoundGain(params[1])
         params[2] = BoundTheta(params[2])
@@ -588,7 +906,10 @@ class phfbMesh(Mesh):
     def set(self):
         raise Exception("Feedback mesh has no 'set' method.")
 
-    def get(self):
+    def WeightVersion(self):
+        return (self.version, self.mesh.WeightVersion())
+
+    def getEffective(self):
         return self.fbScale * self.mesh.Gscale * self.mesh.get().T
     
     def getInput(self):
@@ -690,7 +1011,8 @@ class Crossbar(Mesh):
         self.attenuatorsDB = 10*np.log10(self.attenuators)
 
     def getFromParams(self, params = None):
-        '''Function generates matrix from a list of params.
+        '''Function generates matrix from a list of params. Params stacked
+            along a leading axis return a stack of matrices.
 
             This function should be overwritten for meshes with different
             parameter structures.
@@ -710,7 +1032,7 @@ class Crossbar(Mesh):
         self.matrix = matrix
         self.setParams([np.divide(matrix, self.coupling)])
     
-    def get(self):
+    def getEffective(self):
         '''Returns the current matrix representation multiplied by the Gscale.
             This function is generic to any photonic mesh and should not be
             overwritten.
@@ -740,6 +1062,7 @@ class Crossbar(Mesh):
         self.attenuatorsDB = 10*np.log10(self.attenuators)
         self.DeviceUpdate([-self.attenuatorsDB])
         self.modified = True
+        self.WeightsChanged()
 
     def reshapeParams(self, flatParams):
         '''Reshapes a flattened set of parameters to list format
@@ -774,9 +1097,16 @@ class Crossbar(Mesh):
         '''
         # Split data into diagonal matrix where cols represent wavelength
         # TODO: Check for slowdown because of reshaping in super().applyTo()
-        self.DeviceHold()
+        self.DeviceHold(len(data) if data.ndim > 1 else 1)
         result = super().applyTo(data)
         return result
+
+    def applyChanged(self, delta, changed):
+        '''Applies the changed channels while keeping the same device
+            accounting as applyTo.
+        '''
+        self.DeviceHold(len(delta) if delta.ndim > 1 else 1)
+        return super().applyChanged(delta, changed)
     
     def ApplyUpdate(self, delta, m, n):
         '''Applies the delta vector to the linear weights and calculates the 
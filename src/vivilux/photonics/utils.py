@@ -33,26 +33,382 @@ def BoundGain(gain: np.ndarray, lower=1e-6, upper=np.inf) -> np.ndarray:
     return gain
 
 
+def LeastSquares(X: np.ndarray, y: np.ndarray, rcond: float = 1e-7,
+                 damping: float = 0):
+    '''Solves min ||X @ a - y||^2 + damping * ||a||^2 with a single SVD
+        (np.linalg.lstsq). Singular values of X below rcond times the largest
+        are discarded, which removes redundant directions without pruning
+        columns of X one at a time.
+
+        Returns the solution a, the rank of X and the condition number of
+        the solved system (inf if X has rank 0).
+    '''
+    if damping > 0: # Tikhonov damping as an augmented least squares problem
+        numCols = X.shape[1]
+        X = np.concatenate([X, np.sqrt(damping) * np.eye(numCols)])
+        y = np.concatenate([y, np.zeros((numCols,) + y.shape[1:])])
+    a, _, solvedRank, singularValues = np.linalg.lstsq(X, y, rcond=rcond)
+
+    # singular values of the undamped X
+    xSingularValues = np.sqrt(np.maximum(np.square(singularValues) - damping, 0))
+    if len(xSingularValues) == 0 or xSingularValues[0] == 0:
+        return a, 0, np.inf
+    rank = int(np.sum(xSingularValues > rcond * xSingularValues[0]))
+    condition = singularValues[0] / singularValues[solvedRank-1]
+    return a, rank, condition
+
+
+_stageCache = {}
+_chunkBytes = 2**18 # size of the stacks of matrices built at once by psToRect
+
+def rectStages(size: int) -> list[tuple[slice, slice]]:
+    '''Returns, for each stage of a rectangular MZI mesh, the slice of its
+        units in the parameter array and the slice of waveguides (rows)
+        which they mix in pairs.
+    '''
+    if size not in _stageCache:
+        stages = []
+        index = 0
+        for stage in range(size):
+            parity = stage % 2 # even or odd stage
+            numPairs = (size - parity) // 2
+            stages.append((slice(index, index+numPairs),
+                           slice(parity, parity + 2*numPairs)))
+            index += numPairs
+        _stageCache[size] = stages
+    return _stageCache[size]
+
+def rectTransfer(phaseShifters: np.ndarray):
+    '''Returns the entries a, b, c, d of the 2x2 transfer matrices
+        [[a, b], [c, d]] of each MZI from its phase shifts (theta, phi).
+    '''
+    theta = phaseShifters[..., 0]
+    ePhi = np.exp(1j*phaseShifters[..., 1])
+    a = ePhi * np.sin(theta)
+    b = np.cos(theta).astype(np.cdouble)
+    c = ePhi * b
+    d = -np.sin(theta).astype(np.cdouble)
+    return a, b, c, d
+
 def psToRect(phaseShifters: np.ndarray, size: float) -> np.ndarray:
     '''Calculates the implemented matrix of rectangular MZI from its phase 
         shifts. Assumes ideal components.
+
+        The 2x2 transfer matrices of each stage are applied in place to the
+        pairs of rows they mix. A stack of parameters with shape
+        (K, numUnits, 2) returns the K matrices with shape (K, size, size).
     '''
-    fullMatrix = np.eye(size, dtype=np.cdouble)
-    index = 0
-    for stage in range(size):
-        stageMatrix = np.eye(size, dtype=np.cdouble)
-        parity = stage % 2 # even or odd stage
-        for wg in range(parity, size, 2): 
-            # add MZI weights in pairs
-            if wg >= size-1: break # handle case of last pair
-            theta, phi = phaseShifters[index]
-            index += 1
-            stageMatrix[wg:wg+2,wg:wg+2] = np.array([[np.exp(1j*phi)*np.sin(theta),np.cos(theta)],
-                                                     [np.exp(1j*phi)*np.cos(theta),-np.sin(theta)]],
-                                                     dtype=np.cdouble)
-        fullMatrix[:] = stageMatrix @ fullMatrix
+    phaseShifters = np.asarray(phaseShifters)
+    batchShape = phaseShifters.shape[:-2]
+    numMatrices = int(np.prod(batchShape))
+    chunkSize = max(1, _chunkBytes // (16 * size * size))
+    if numMatrices > chunkSize: # keep the working set of each chunk in cache
+        flatParams = phaseShifters.reshape(numMatrices, *phaseShifters.shape[-2:])
+        fullMatrix = np.empty((numMatrices, size, size), dtype=np.cdouble)
+        for start in range(0, numMatrices, chunkSize):
+            chunk = slice(start, start + chunkSize)
+            fullMatrix[chunk] = psToRect(flatParams[chunk], size)
+        return fullMatrix.reshape(batchShape + (size, size))
+
+    a, b, c, d = [coeff[..., None] for coeff in rectTransfer(phaseShifters)]
+
+    fullMatrix = np.zeros(batchShape + (size, size), dtype=np.cdouble)
+    fullMatrix[..., np.arange(size), np.arange(size)] = 1
+    for units, rows in rectStages(size):
+        _mixRows(fullMatrix, rows, a[..., units, :], b[..., units, :],
+                 c[..., units, :], d[..., units, :])
     return fullMatrix
 
+def _mixRows(matrix, rows, a, b, c, d):
+    '''Left multiplies matrix in place by the 2x2 transfer matrices
+        [[a, b], [c, d]] acting on consecutive pairs of the given rows.
+    '''
+    # view the rows of the stage as (numPairs, 2, numCols)
+    pairs = matrix[..., rows, :]
+    pairs = pairs.reshape(pairs.shape[:-2] + (-1, 2, matrix.shape[-1]))
+    upper = pairs[..., 0, :]
+    lower = pairs[..., 1, :]
+    newUpper = a * upper + b * lower
+    lower *= d
+    lower += c * upper
+    upper[:] = newUpper
+
+def _mixCols(matrix, cols, a, b, c, d):
+    '''Right multiplies matrix in place by the 2x2 transfer matrices
+        [[a, b], [c, d]] acting on consecutive pairs of the given columns.
+    '''
+    pairs = matrix[:, cols].reshape(matrix.shape[0], -1, 2)
+    left = pairs[..., 0]
+    right = pairs[..., 1]
+    newLeft = left * a + right * c
+    right *= d
+    right += left * b
+    left[:] = newLeft
+
+def rectProducts(phaseShifters: np.ndarray, size: int,
+                 left: np.ndarray = None, right: np.ndarray = None):
+    '''Calculates the products of the stages of a rectangular MZI before
+        (prefixes) and after (suffixes) each stage, optionally multiplied by
+        `left` and `right` matrices.
+
+        Returns prefixes with shape (numStages+1, size, cols), suffixes with
+        shape (numStages, rows, size) and the full matrix
+        left @ psToRect(phaseShifters, size) @ right.
+    '''
+    a, b, c, d = rectTransfer(phaseShifters)
+    stages = rectStages(size)
+
+    prefix = (np.eye(size, dtype=np.cdouble) if right is None else
+              np.array(right, dtype=np.cdouble))
+    prefixes = np.empty((len(stages)+1,) + prefix.shape, dtype=np.cdouble)
+    prefixes[0] = prefix
+    for stage, (units, rows) in enumerate(stages):
+        _mixRows(prefix, rows, a[units, None], b[units, None],
+                 c[units, None], d[units, None])
+        prefixes[stage+1] = prefix
+
+    suffix = (np.eye(size, dtype=np.cdouble) if left is None else
+              np.array(left, dtype=np.cdouble))
+    suffixes = np.empty((len(stages),) + suffix.shape, dtype=np.cdouble)
+    for stage in reversed(range(len(stages))):
+        units, rows = stages[stage]
+        suffixes[stage] = suffix
+        _mixCols(suffix, rows, a[units], b[units], c[units], d[units])
+
+    matrix = prefix if left is None else left @ prefix
+    return prefixes, suffixes, matrix
+
+def psToRectUpdate(phaseShifters: np.ndarray, size: int, products: tuple,
+                   changed: np.ndarray) -> np.ndarray:
+    '''Recalculates the matrix of a rectangular MZI when only the units
+        with indices `changed` differ from the mesh whose stage products
+        (see rectProducts) are given. Changes within a single stage are
+        added as rank-2 updates of the cached matrix. Otherwise the stages
+        spanned by the changes are reapplied to the cached prefix and
+        multiplied by the cached suffix.
+    '''
+    prefixes, suffixes, matrix = products
+    changed = np.unique(changed)
+    if len(changed) == 0:
+        return matrix.copy()
+    stages = rectStages(size)
+    starts = [units.start for units, _ in stages]
+    changedStages = np.searchsorted(starts, changed, side="right") - 1
+    first, last = changedStages.min(), changedStages.max()
+    a, b, c, d = rectTransfer(phaseShifters)
+
+    if first == last: # update only the rows mixed by the changed units
+        units, rows = stages[first]
+        top = rows.start + 2*(changed - units.start)
+        pairRows = np.stack([top, top+1], axis=1).flatten()
+        newRows = prefixes[first][pairRows]
+        _mixRows(newRows, slice(None), a[changed, None], b[changed, None],
+                 c[changed, None], d[changed, None])
+        deltaRows = newRows - prefixes[first+1][pairRows]
+        return matrix + suffixes[first][:, pairRows] @ deltaRows
+
+    block = prefixes[first].copy()
+    for units, rows in stages[first:last+1]:
+        _mixRows(block, rows, a[units, None], b[units, None],
+                 c[units, None], d[units, None])
+    return suffixes[last] @ block
+
+def psToRectJacobian(phaseShifters: np.ndarray, size: int,
+                     left: np.ndarray = None, right: np.ndarray = None):
+    '''Calculates the derivatives of the matrix of a rectangular MZI with
+        respect to each of its phase shifts. The derivative for a unit in a
+        given stage is the rank-2 product of the suffix of the stages after
+        it, its differentiated 2x2 transfer matrix and the prefix of the
+        stages before it (see rectProducts). Assumes ideal components.
+
+        If `left` or `right` matrices are given, the derivatives of
+        left @ psToRect(phaseShifters, size) @ right are returned instead.
+
+        Returns the matrix and its derivatives with shape
+        (numUnits, 2, rows, cols), where the second axis is (theta, phi).
+    '''
+    a, b, c, d = rectTransfer(phaseShifters)
+    prefixes, suffixes, matrix = rectProducts(phaseShifters, size, left, right)
+    numRows, numCols = suffixes.shape[1], prefixes.shape[2]
+
+    derivatives = np.empty((len(phaseShifters), 2, numRows, numCols),
+                           dtype=np.cdouble)
+    for stage, (units, rows) in enumerate(rectStages(size)):
+        pairs = prefixes[stage][rows].reshape(-1, 2, numCols)
+        prefixTop, prefixBottom = pairs[:, 0, :], pairs[:, 1, :]
+        pairs = suffixes[stage][:, rows].reshape(numRows, -1, 2)
+        suffixTop, suffixBottom = pairs[..., 0].T, pairs[..., 1].T
+
+        # d/dtheta of [[a, b], [c, d]] is [[c, d], [-a, -b]]
+        leftTop = suffixTop * c[units, None] - suffixBottom * a[units, None]
+        leftBottom = suffixTop * d[units, None] - suffixBottom * b[units, None]
+        derivatives[units, 0] = (leftTop[:, :, None] * prefixTop[:, None, :] +
+                                 leftBottom[:, :, None] * prefixBottom[:, None, :])
+        # d/dphi of [[a, b], [c, d]] is [[1j*a, 0], [1j*c, 0]]
+        leftTop = 1j * (suffixTop * a[units, None] + suffixBottom * c[units, None])
+        derivatives[units, 1] = leftTop[:, :, None] * prefixTop[:, None, :]
+
+    return matrix, derivatives
+
+
+def rectDecompose(unitary: np.ndarray):
+    '''Decomposes a unitary matrix into the phase shifts of a rectangular
+        MZI mesh (Clements et al., 2016). Elements are nulled along the
+        anti-diagonals by MZIs applied alternately from the right and from
+        the left, and the remaining diagonal is then moved to the output.
+        Each MZI is assigned to the stage of its waveguide pair given by its
+        order in the mesh.
+
+        Returns phaseShifters and the output phases, such that
+        unitary = diag(outputPhases) @ psToRect(phaseShifters, size).
+    '''
+    U = np.array(unitary, dtype=np.cdouble)
+    size = len(U)
+    rightOps, leftOps = [], [] # (top waveguide, theta, phi)
+    for diagonal in range(1, size):
+        if diagonal % 2 == 1: # null from the right with T^-1 on columns
+            for j in range(diagonal):
+                row, col = size-1-j, diagonal-1-j
+                x, y = U[row, col], U[row, col+1]
+                theta = np.arctan2(np.abs(y), np.abs(x))
+                phi = np.angle(-x * np.conj(y))
+                # T^-1 = [[conj(ePhi)*sin, conj(ePhi)*cos], [cos, -sin]]
+                ePhi = np.exp(-1j*phi)
+                colX, colY = U[:, col].copy(), U[:, col+1].copy()
+                U[:, col] = colX * ePhi * np.sin(theta) + colY * np.cos(theta)
+                U[:, col+1] = colX * ePhi * np.cos(theta) - colY * np.sin(theta)
+                rightOps.append((col, theta, phi))
+        else: # null from the left with T on rows
+            for j in range(1, diagonal+1):
+                row, col = size+j-diagonal-1, j-1
+                x, y = U[row-1, col], U[row, col]
+                theta = np.arctan2(np.abs(x), np.abs(y))
+                phi = np.angle(y * np.conj(x))
+                a, b, c, d = rectTransfer(np.array([theta, phi]))
+                rowX, rowY = U[row-1].copy(), U[row].copy()
+                U[row-1] = a * rowX + b * rowY
+                U[row] = c * rowX + d * rowY
+                leftOps.append((row-1, theta, phi))
+
+    # move the diagonal through the inverses of the left MZIs to the output
+    outputPhases = np.diag(U).copy()
+    movedOps = []
+    for top, theta, phi in reversed(leftOps):
+        d1, d2 = outputPhases[top], outputPhases[top+1]
+        movedOps.append((top, theta, np.angle(d1/d2)))
+        outputPhases[top] = d2 * np.exp(-1j*phi)
+        outputPhases[top+1] = d2
+
+    # assign each MZI to the next stage of its waveguide pair
+    stages = rectStages(size)
+    phaseShifters = np.zeros((size*(size-1)//2, 2))
+    numPlaced = np.zeros(size, dtype=int)
+    for top, theta, phi in rightOps + movedOps:
+        stage = top % 2 + 2*numPlaced[top]
+        numPlaced[top] += 1
+        units, rows = stages[stage]
+        phaseShifters[units.start + (top - rows.start)//2] = theta, phi
+    return BoundTheta(phaseShifters % (2*np.pi)), outputPhases
+
+def Unistochastic(powerMatrix: np.ndarray, phases: np.ndarray,
+                  numIterations: int = 500, relaxation: float = 0.999,
+                  ) -> np.ndarray:
+    '''Finds a unitary U whose power matrix |U|^2 approximates the given
+        non-negative matrix, starting from the given complex `phases`. The
+        matrix is first balanced to be doubly stochastic (Sinkhorn), then the
+        set of matrices with amplitudes sqrt(powerMatrix) and the set of
+        unitaries (polar decomposition) are intersected by relaxed averaged
+        alternating reflections (RAAR), which escape many of the local minima
+        that stall plain alternating projections. Not every doubly
+        stochastic matrix is unistochastic, in which case the result is an
+        approximation.
+    '''
+    target = np.maximum(powerMatrix, 0) + 1e-12
+    for _ in range(100): # Sinkhorn balancing
+        target /= np.sum(target, axis=1, keepdims=True)
+        target /= np.sum(target, axis=0, keepdims=True)
+    amplitudes = np.sqrt(target)
+
+    def ProjectAmplitudes(X):
+        return amplitudes * np.exp(1j*np.angle(X))
+    def ProjectUnitary(X):
+        W, _, Vh = np.linalg.svd(X)
+        return W @ Vh # nearest unitary
+
+    X = amplitudes * phases
+    for _ in range(numIterations):
+        projected = ProjectAmplitudes(X)
+        X = (relaxation * (X + ProjectUnitary(2*projected - X) - projected) +
+             (1 - relaxation) * projected)
+    return ProjectUnitary(ProjectAmplitudes(X))
+
+def rectFitPower(phaseShifters: np.ndarray, powerMatrix: np.ndarray,
+                 numSteps: int = 100, tol: float = 1e-12):
+    '''Refines the phase shifts of a rectangular MZI so that its power
+        matrix matches `powerMatrix`, with Levenberg-Marquardt iterations on
+        the amplitudes |U| (see psToRectJacobian). Fitting the amplitudes
+        instead of the powers keeps the gradients of nearly dark outputs.
+
+        Returns the phase shifts and the maximum error of the power matrix.
+    '''
+    size = len(powerMatrix)
+    amplitudes = np.sqrt(np.maximum(powerMatrix, 0)).flatten()
+    residual = lambda params: np.abs(psToRect(params, size)).flatten() - amplitudes
+    phaseShifters = phaseShifters.copy()
+    error = residual(phaseShifters)
+    cost = error @ error
+    damping = 1e-3
+    for _ in range(numSteps):
+        if np.sqrt(cost) < tol:
+            break
+        matrix, derivatives = psToRectJacobian(phaseShifters, size)
+        jac = (np.real(np.conj(matrix) * derivatives) /
+               (np.abs(matrix) + 1e-9)).reshape(-1, size*size).T
+        jtj = jac.T @ jac
+        jtr = jac.T @ error
+        scaling = np.diag(jtj) + 1e-9 * np.max(np.diag(jtj))
+        while damping < 1e8: # increase the damping until a step is accepted
+            step = np.linalg.solve(jtj + damping*np.diag(scaling), jtr)
+            updated = phaseShifters - step.reshape(phaseShifters.shape)
+            newError = residual(updated)
+            if newError @ newError < cost:
+                phaseShifters, error = updated, newError
+                cost = error @ error
+                damping = max(damping/3, 1e-12)
+                break
+            damping *= 4
+        else: # local minimum
+            break
+    powerError = np.square(np.abs(psToRect(phaseShifters, size))) - powerMatrix
+    return BoundTheta(phaseShifters % (2*np.pi)), np.max(np.abs(powerError))
+
+def rectDecomposePower(powerMatrix: np.ndarray, unitary: np.ndarray = None,
+                       numRestarts: int = 10, rng = np.random,
+                       tol: float = 1e-8):
+    '''Finds the phase shifts of a rectangular MZI whose power matrix is
+        `powerMatrix` (or its nearest achievable approximation). A unitary
+        is found with Unistochastic, decomposed with rectDecompose and
+        refined with rectFitPower. Both iterations are local, so they are
+        started from the phases of `unitary` if given (e.g. the current
+        state of a mesh) and from up to `numRestarts` random phases drawn
+        from `rng`, until the maximum error of the power matrix is below
+        `tol`.
+
+        Returns the phase shifts with the lowest error and the error.
+    '''
+    initialPhases = [] if unitary is None else [np.exp(1j*np.angle(unitary))]
+    initialPhases += [None] * numRestarts # drawn only when needed
+    best, bestError = None, np.inf
+    for phases in initialPhases:
+        if phases is None:
+            phases = np.exp(2j*np.pi*rng.rand(*powerMatrix.shape))
+        phaseShifters, _ = rectDecompose(Unistochastic(powerMatrix, phases))
+        phaseShifters, error = rectFitPower(phaseShifters, powerMatrix)
+        if error < bestError:
+            best, bestError = phaseShifters, error
+        if bestError < tol:
+            break
+    return best, bestError
 
 def crossbarCoupling(shape):
     '''Calculates coupling coefficients which can be used to make a simple
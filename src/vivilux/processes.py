@@ -10,6 +10,8 @@ from abc import ABC, abstractmethod
 
 import numpy as np
 
+from . import kernels
+
 # import defaults
 # from .activations import Sigmoid
 # from .learningRules import CHL
@@ -68,21 +70,37 @@ class FFFB(NeuralProcess):
         self.isFloating = False
 
     def StepTime(self):
-        FFFBparams = self.FFFBparams
+        p = self.pool.params # frozen FFFBparams
         poolGe = self.pool.Ge
-        avgGe = np.mean(poolGe)
-        maxGe = np.max(poolGe)
-        avgAct = np.mean(self.poolAct)
+        avgGe = np.mean(poolGe, axis=-1, keepdims=True)
+        maxGe = np.max(poolGe, axis=-1, keepdims=True)
+        avgAct = np.mean(self.poolAct, axis=-1, keepdims=True)
 
         # Scalar feedforward inhibition proportional to max and avg Ge
-        ffNetin = avgGe + FFFBparams["MaxVsAvg"] * (maxGe - avgGe)
-        ffi = FFFBparams["FF"] * np.maximum(ffNetin - FFFBparams["FF0"], 0)
+        ffNetin = avgGe + p.MaxVsAvg * (maxGe - avgGe)
+        ffi = p.FF * np.maximum(ffNetin - p.FF0, 0)
 
         # Scalar feedback inhibition based on average activity in the pool
-        self.fbi += FFFBparams["FBDt"] * FFFBparams["FB"] * (avgAct - self.fbi)
+        self.fbi += p.FBDt * (avgAct - self.fbi)
 
         # Add inhibition to the inhibition
-        self.pool.Gi_FFFB = FFFBparams["Gi"] * (ffi + self.fbi)
+        self.pool.Gi_FFFB = p.FFFBGi * (ffi + self.fbi)
+
+    def SteadyState(self):
+        '''Sets the inhibition to the equilibrium of StepTime for the current
+            pool Ge and activity, where the feedback inhibition is equal to the
+            average activity.
+        '''
+        p = self.pool.params # frozen FFFBparams
+        poolGe = self.pool.Ge
+        avgGe = np.mean(poolGe, axis=-1, keepdims=True)
+        maxGe = np.max(poolGe, axis=-1, keepdims=True)
+
+        ffNetin = avgGe + p.MaxVsAvg * (maxGe - avgGe)
+        ffi = p.FF * np.maximum(ffNetin - p.FF0, 0)
+        self.fbi = np.mean(self.pool.getActivity(), axis=-1, keepdims=True)
+
+        self.pool.Gi_FFFB = p.FFFBGi * (ffi + self.fbi)
 
     def UpdateAct(self):
         self.poolAct = self.pool.getActivity()
@@ -91,6 +109,17 @@ class FFFB(NeuralProcess):
         self.fbi = 0
         self.poolAct[:] = 0
 
+    def InitBatch(self, batchSize: int):
+        '''Expands the feedback inhibition and pool activity with a leading
+            batch dimension (one pool per sample).
+        '''
+        self.fbi = np.full((batchSize, 1), self.fbi, dtype=float)
+        self.poolAct = self.pool.getActivity()
+
+    def EndBatch(self, index: int = -1):
+        self.fbi = self.fbi[index].copy()
+        self.poolAct = self.pool.getActivity()
+
 class ActAvg(PhasicProcess):
     '''A process for calculating average neuron activities for learning.
         Coordinates with the XCAL process to perform learning.
@@ -180,11 +209,30 @@ class ActAvg(PhasicProcess):
             to serve as input for learning rules and other processes.
         '''
         Act = self.pool.getActivity()
-        self.AvgSS += self.SSdt * (Act - self.AvgSS)
-        self.AvgS += self.Sdt * (self.AvgSS - self.AvgS)
-        self.AvgM += self.Mdt * (self.AvgS - self.AvgM)
+        if self.pool.useNumba and Act.ndim == 1:
+            return kernels.StepActAvg(self)
+
+        p = self.pool.params # integrator dependent rates
+        self.AvgSS += p.SSdt * (Act - self.AvgSS)
+        self.AvgS += p.Sdt * (self.AvgSS - self.AvgS)
+        self.AvgM += p.Mdt * (self.AvgS - self.AvgM)
         self.AvgSLrn = (1-self.LrnM) * self.AvgS + self.LrnM * self.AvgM
 
+    def InitBatch(self, batchSize: int):
+        '''Expands the short and medium term averages with a leading batch
+            dimension. Long term averages are shared across the batch.
+        '''
+        self.AvgSS = np.repeat(self.AvgSS[np.newaxis], batchSize, axis=0)
+        self.AvgS = np.repeat(self.AvgS[np.newaxis], batchSize, axis=0)
+        self.AvgM = np.repeat(self.AvgM[np.newaxis], batchSize, axis=0)
+        self.AvgSLrn = np.repeat(self.AvgSLrn[np.newaxis], batchSize, axis=0)
+
+    def EndBatch(self, index: int = -1):
+        self.AvgSS = self.AvgSS[index].copy()
+        self.AvgS = self.AvgS[index].copy()
+        self.AvgM = self.AvgM[index].copy()
+        self.AvgSLrn = self.AvgSLrn[index].copy()
+
     def StepPhase(self):
         '''Updates longer term running averages for the sake of the learning rule
         '''
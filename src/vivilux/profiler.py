@@ -0,0 +1,200 @@
+'''Opt-in timing of the hot stages of a net (see Net.Learn(profile=True)).
+
+    The profiler wraps the methods of the stages on the instances of a net
+    (e.g. `layer.Integrate`) with timers while it is attached, and removes
+    them when detached, so that an unprofiled net runs without any overhead.
+    Times are inclusive, i.e. the time of a stage includes the time of the
+    stages it calls (e.g. UpdateConductances includes Layer.Integrate and
+    Mesh.apply). Only methods are wrapped, so that the layers still use the
+    same backend (see kernels.Supports). The activation is timed as part of
+    Layer.StepActivity, since the numba kernel fuses it into the step, and
+    likewise FFFB.StepTime and ActAvg.StepTime are not called by layers
+    using the numba backend.
+'''
+
+# type checking
+from __future__ import annotations
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from .nets import Net
+
+from threading import Lock
+from time import perf_counter
+
+import numpy as np
+
+STAGES = ["Net.StepPhase",
+          "UpdateConductances", # Layer.UpdateConductance of each layer
+          "Layer.Integrate",
+          "Mesh.apply",
+          "Layer.StepActivity", # including the activation function
+          "FFFB.StepTime",
+          "ActAvg.StepTime",
+          "Net.UpdateMeshes", # wall time of the mesh updates (see ParallelLearn)
+          "Mesh.Update", # summed over meshes updated concurrently
+          "XCAL.GetDeltas",
+          "MZImesh.ApplyDelta",
+          ]
+
+class Profiler:
+    '''Accumulates the time and number of calls of each stage (see STAGES)
+        per trial, and groups the trials by epoch.
+    '''
+    def __init__(self):
+        self.stages = STAGES
+        self.lock = Lock() # meshes may be updated in threads (see ParallelLearn)
+        self.net: Net = None
+        self.wrapped = [] # (owner, attribute, original) of each wrapped method
+        self.Reset()
+
+    def __getstate__(self): # locks can not be copied
+        state = vars(self).copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        vars(self).update(state)
+        self.lock = Lock()
+
+    def Reset(self):
+        '''Clears all recorded times.
+        '''
+        self.times = [0.0] * len(self.stages) # of the current trial
+        self.calls = [0] * len(self.stages)
+        self.trialTimes = []
+        self.trialCalls = []
+        self.epochStarts = []
+
+    def Attach(self, net: Net):
+        '''Wraps the stages of every layer and mesh of the net with timers.
+        '''
+        if self.net is not None:
+            self.Detach()
+        self.net = net
+
+        self.Wrap(net, "StepPhase", "Net.StepPhase")
+        self.Wrap(net, "UpdateMeshes", "Net.UpdateMeshes")
+        self.Wrap(net, "StepTrial", None, self.EndTrial)
+        self.Wrap(net, "RunEpoch", None, self.StartEpoch, before=True)
+        for layer in net.layers:
+            self.Wrap(layer, "UpdateConductance", "UpdateConductances")
+            self.Wrap(layer, "Integrate", "Layer.Integrate")
+            self.Wrap(layer.FFFB, "StepTime", "FFFB.StepTime")
+            self.Wrap(layer.ActAvg, "StepTime", "ActAvg.StepTime")
+            self.Wrap(layer, "StepActivity", "Layer.StepActivity")
+
+            for mesh in layer.excMeshes + layer.inhMeshes:
+                self.Wrap(mesh, "apply", "Mesh.apply")
+                self.Wrap(mesh, "Update", "Mesh.Update")
+                if hasattr(mesh, "XCAL"):
+                    self.Wrap(mesh.XCAL, "GetDeltas", "XCAL.GetDeltas")
+                if hasattr(mesh, "ApplyDelta"):
+                    self.Wrap(mesh, "ApplyDelta", "MZImesh.ApplyDelta")
+
+        if net.plans is not None: # plans hold the unwrapped methods
+            net.Compile(net.backend)
+
+    def Detach(self):
+        '''Restores the original methods of the net.
+        '''
+        for owner, attribute, original in reversed(self.wrapped):
+            if original is None:
+                delattr(owner, attribute)
+            else:
+                setattr(owner, attribute, original)
+        self.wrapped = []
+
+        net, self.net = self.net, None
+        if net is not None and net.plans is not None:
+            net.Compile(net.backend)
+
+    def Timer(self, method, stage: str):
+        '''Returns `method` wrapped with a timer accumulating into `stage`.
+        '''
+        index = self.stages.index(stage)
+        times, calls, lock = self.times, self.calls, self.lock
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                with lock:
+                    times[index] += elapsed
+                    calls[index] += 1
+        return timed
+
+    def Wrap(self, owner, attribute: str, stage: str = None, hook = None,
+             before: bool = False):
+        '''Replaces the method `attribute` of the instance `owner` with a
+            timed version for the given stage, or with a version calling
+            `hook` after (or before) the method.
+        '''
+        method = getattr(owner, attribute)
+        if stage is not None:
+            wrapped = self.Timer(method, stage)
+        elif before:
+            def wrapped(*args, **kwargs):
+                hook()
+                return method(*args, **kwargs)
+        else:
+            def wrapped(*args, **kwargs):
+                result = method(*args, **kwargs)
+                hook()
+                return result
+        # methods are restored by deleting the instance attribute
+        original = vars(owner).get(attribute)
+        setattr(owner, attribute, wrapped)
+        self.wrapped.append((owner, attribute, original))
+
+    def StartEpoch(self):
+        self.epochStarts.append(len(self.trialTimes))
+
+    def EndTrial(self):
+        with self.lock:
+            self.trialTimes.append(list(self.times))
+            self.trialCalls.append(list(self.calls))
+            for index in range(len(self.stages)):
+                self.times[index] = 0.0
+                self.calls[index] = 0
+
+    def Report(self) -> dict:
+        '''Returns the recorded timing:
+
+            - stages: names of the stages (columns of the arrays below)
+            - trials: (numTrials, numStages) seconds spent in each trial
+            - trialCalls: (numTrials, numStages) number of calls in each trial
+            - epochs: (numEpochs, numStages) seconds spent in each epoch
+            - epochTrials: number of trials in each epoch
+            - total: dict of the total seconds spent in each stage
+            - calls: dict of the total number of calls of each stage
+        '''
+        numStages = len(self.stages)
+        trials = np.array(self.trialTimes).reshape(-1, numStages)
+        trialCalls = np.array(self.trialCalls, dtype=int).reshape(-1, numStages)
+        bounds = self.epochStarts + [len(trials)]
+        epochs = np.array([np.sum(trials[start:end], axis=0)
+                           for start, end in zip(bounds[:-1], bounds[1:])])
+        return {
+            "stages": list(self.stages),
+            "trials": trials,
+            "trialCalls": trialCalls,
+            "epochs": epochs.reshape(-1, numStages),
+            "epochTrials": np.diff(bounds),
+            "total": dict(zip(self.stages, np.sum(trials, axis=0))),
+            "calls": dict(zip(self.stages, np.sum(trialCalls, axis=0))),
+        }
+
+    def Summary(self) -> str:
+        '''Returns a table of the total and per trial time of each stage.
+        '''
+        report = self.Report()
+        numTrials = max(len(report["trials"]), 1)
+        lines = [f"{'stage':<20}{'total (s)':>12}{'per trial (ms)':>16}"
+                 f"{'calls':>10}"]
+        for stage in self.stages:
+            total = report["total"][stage]
+            lines.append(f"{stage:<20}{total:>12.3f}"
+                         f"{1e3*total/numTrials:>16.3f}"
+                         f"{report['calls'][stage]:>10d}")
+        return "\n".join(lines)
@@ -1,11 +1,14 @@
+'''Monitors and visualizations of network activity.
+
+    matplotlib, networkx and imageio are imported where they are first used,
+    so that importing vivilux does not pay for them.
+'''
 from __future__ import annotations
 import numpy as np
-import matplotlib.pyplot as plt
-import networkx as nx
-import imageio
 
 from io import BytesIO
 from math import ceil, floor
+from time import perf_counter
 from typing import TYPE_CHECKING
 
 
@@ -13,30 +16,101 @@ if TYPE_CHECKING:
     from vivilux import Net, Layer, Mesh
 
 
+def RenderMonitor(monitorType: type, state: dict, queue):
+    '''Runs in a separate process for monitors with background=True. Creates
+        the figure of the monitor and redraws it with the latest data received
+        through the queue, until None is received.
+    '''
+    import matplotlib.pyplot as plt
+    from queue import Empty
+    monitor = monitorType.__new__(monitorType)
+    vars(monitor).update(state)
+    monitor.background = False
+    monitor.CreateFigure()
+    plt.show(block=False)
+
+    while True:
+        try:
+            update = queue.get(timeout=0.05)
+        except Empty: # keep the window responsive
+            monitor.fig.canvas.start_event_loop(0.05)
+            continue
+        if update is None:
+            break
+        vars(monitor).update(update)
+        monitor.Draw()
+    plt.show() # keep the final figure open until it is closed
+
+
 class Monitor:
-    '''A base class for monitoring network activity
+    '''A base class for monitoring network activity. The data is written
+        into a ring buffer of the last `limits[0]` time steps, and the figure
+        is redrawn only every `drawInterval` updates, or if None, in frames
+        of at most `frameRate` per second. The frames are shared by all the
+        monitors drawn in the process, and the time between frames is at
+        least the time taken to draw the last one, so that the simulation
+        runs at least half of the time.
+
+        With background=True, the figure is drawn by a separate process fed
+        through a queue, so that the simulation never waits for matplotlib.
+        Updates are dropped while the process is busy drawing. Scripts using
+        background monitors must be guarded by `if __name__ == "__main__":`
+        on platforms which spawn processes, and should call Close() at the
+        end to keep the figure open.
     '''
+    figureAttributes = ["fig", "ax", "axs", "lines", "magnitude",
+                        "queue", "process"]
+    frame = {"number": 0, "start": 0.0, "end": 0.0} # shared by all monitors
+
     def __init__(self, name: str, labels: list[str], 
                  limits: list[float], numLines: int = 0, 
                  enable = True, legend = True, resizeAxes = False,
-                 target = "activity") -> None:
+                 target = "activity", drawInterval: int = None,
+                 frameRate: float = 30, background = False) -> None:
         self.name = name
         self.enable = enable
         self.target = target
         self.resizeAxes = resizeAxes
+        self.legend = legend
 
         self.xlabel = labels[0]
         self.ylabel = labels[1]
         self.xlim = limits[0]
         self.ylim = limits[1]
-     
-        #initialize figure
-        self.fig = plt.figure()
-        self.ax = self.fig.add_subplot(111)
 
         #trace updates
         self.data = np.zeros((self.xlim, numLines))
         self.index = 0
+        self.ymax = 1
+
+        self.InitDisplay(drawInterval, frameRate, background)
+
+    def InitDisplay(self, drawInterval: int, frameRate: float, background: bool):
+        '''Creates the figure, or the process drawing it.
+        '''
+        self.drawInterval = drawInterval
+        self.frameRate = frameRate
+        self.background = background
+        self.numPending = 0 # updates since the last draw
+        self.lastDraw = 0
+        self.frameNumber = 0 # last frame drawn
+
+        if background:
+            import multiprocessing as mp
+            state = {key: value for key, value in vars(self).items()
+                     if key not in self.figureAttributes}
+            self.queue = mp.Queue(maxsize=2)
+            self.process = mp.Process(target=RenderMonitor,
+                                      args=(type(self), state, self.queue),
+                                      daemon=True)
+            self.process.start()
+        else:
+            self.CreateFigure()
+
+    def CreateFigure(self):
+        import matplotlib.pyplot as plt
+        self.fig = plt.figure()
+        self.ax = self.fig.add_subplot(111)
         
         self.lines = self.ax.plot(self.data)
 
@@ -44,27 +118,97 @@ class Monitor:
         self.ax.set_xlabel(self.xlabel)
         self.ax.set_ylabel(self.ylabel)
         self.ax.set_ylim(0, self.ylim)
-        if legend:
-            self.ax.legend(range(numLines))
+        if self.legend:
+            self.ax.legend(range(self.data.shape[1]))
 
     def update(self, newData: dict[str, np.array]):
         if self.enable:
-            self.data[self.index] = newData[self.target]
-
-            for lineIndex, line in enumerate(self.lines):
-                line.set_ydata(self.data[:, lineIndex])
-                
-            if self.resizeAxes:
-                if self.index == 0:
-                    self.ymax = 1
-                self.ymax = np.max([self.ymax, np.max(self.data)])
-                self.ax.set_ylim(0, 1.2*self.ymax)
-
+            self.Record(newData)
             self.index = self.index + 1 if self.index < self.xlim-1 else 0
-
-            #update the plot
-            self.fig.canvas.draw()
-            self.fig.canvas.flush_events()
+            self.numPending += 1
+            if self.drawInterval is not None:
+                isDue = self.numPending >= self.drawInterval
+            elif self.background:
+                isDue = perf_counter() - self.lastDraw >= 1/self.frameRate
+            else:
+                isDue = self.IsFrameDue()
+            if isDue:
+                self.Flush()
+
+    def IsFrameDue(self) -> bool:
+        '''Starts a new frame if it is time to, and returns True if the
+            monitor has not been drawn in the current frame.
+        '''
+        frame = Monitor.frame
+        now = perf_counter()
+        period = max(1/self.frameRate, frame["end"] - frame["start"])
+        if now - frame["end"] >= period:
+            frame["number"] += 1
+            frame["start"] = now
+        return self.frameNumber < frame["number"]
+
+    def Record(self, newData: dict[str, np.array]):
+        '''Writes the new data into the ring buffer.
+        '''
+        self.data[self.index] = newData[self.target]
+        if self.resizeAxes:
+            if self.index == 0:
+                self.ymax = 1
+            self.ymax = np.max([self.ymax, np.max(self.data)])
+
+    def Flush(self, timeout: float = 0):
+        '''Draws any updates which have not been drawn yet.
+
+            Background monitors wait up to `timeout` seconds for room in the
+            queue. If it stays full, the updates are kept pending and sent by
+            the next flush.
+        '''
+        if self.numPending == 0:
+            return
+        self.lastDraw = perf_counter()
+        if not self.background:
+            self.numPending = 0
+            self.Draw()
+            self.frameNumber = Monitor.frame["number"]
+            Monitor.frame["end"] = perf_counter()
+            return
+        if not self.process.is_alive(): # the figure was closed
+            self.numPending = 0
+            return
+        from queue import Full
+        try:
+            self.queue.put(self.DisplayState(), timeout=timeout)
+            self.numPending = 0
+        except Full:
+            pass # the process is still drawing, retry at the next flush
+
+    def DisplayState(self) -> dict:
+        '''Returns the attributes needed to draw the figure.
+        '''
+        return {"data": self.data.copy(), "index": self.index, "ymax": self.ymax}
+
+    def Draw(self):
+        for lineIndex, line in enumerate(self.lines):
+            line.set_ydata(self.data[:, lineIndex])
+            
+        if self.resizeAxes:
+            self.ax.set_ylim(0, 1.2*self.ymax)
+
+        #update the plot
+        self.fig.canvas.draw()
+        self.fig.canvas.flush_events()
+
+    def Close(self):
+        '''Draws the remaining updates and, for background monitors, waits
+            until the figure is closed.
+        '''
+        if not self.background:
+            self.Flush()
+        elif self.process.is_alive():
+            self.numPending = 0
+            self.queue.put(self.DisplayState()) # waits to keep the last update
+            self.queue.put(None)
+            self.process.join()
 
 class Magnitude(Monitor):
     def __init__(self, name: str, labels: list[str], 
@@ -81,28 +225,29 @@ class Magnitude(Monitor):
                          legend=legend,
                          resizeAxes=resizeAxes,
                          **kwargs)
+
+    def CreateFigure(self):
+        super().CreateFigure()
         mag = np.sqrt(np.sum(np.square(self.data), axis=1))
         self.magnitude = self.ax.plot(mag, "--")
-        if legend:
-            self.ax.legend([*range(numLines), "magnitude"])
-    
-    def update(self, newData: dict[str, np.array]):
-        if self.enable:
-            super().update(newData)
-            mag = np.sqrt(np.sum(np.square(self.data), axis=1))
-            self.magnitude[0].set_ydata(mag)
-            
-            if self.resizeAxes:
-                self.ymax = np.max([self.ymax, np.max(mag)])
-                self.ax.set_ylim(0, 1.2*self.ymax)
+        if self.legend:
+            self.ax.legend([*range(self.data.shape[1]), "magnitude"])
 
-            #update the plot
-            self.fig.canvas.draw()
-            self.fig.canvas.flush_events()
+    def Record(self, newData: dict[str, np.array]):
+        super().Record(newData)
+        if self.resizeAxes:
+            mag = np.sqrt(np.sum(np.square(self.data), axis=1))
+            self.ymax = np.max([self.ymax, np.max(mag)])
+    
+    def Draw(self):
+        mag = np.sqrt(np.sum(np.square(self.data), axis=1))
+        self.magnitude[0].set_ydata(mag)
+        super().Draw()
 
 class Multimonitor(Monitor):
     def __init__(self, name: str, labels: list[str], limits: list[float], numLines: int = 0,
-                 enable=True, targets=["activity"], defMonitor = Monitor) -> None:
+                 enable=True, targets=["activity"], defMonitor = Monitor,
+                 **kwargs) -> None:
         self.name = name
         self.targets = targets
         self.enable = enable
@@ -110,10 +255,12 @@ class Multimonitor(Monitor):
         for target in targets:
             if target == "gain":
                 self.monitors.append(defMonitor(name+f"--({target})", labels,
-                                                limits, numLines = 1, target=target))
+                                                limits, numLines = 1, target=target,
+                                                **kwargs))
             else:
                 self.monitors.append(defMonitor(name+f"--({target})", labels,
-                                                limits, numLines, target=target))
+                                                limits, numLines, target=target,
+                                                **kwargs))
             
         # numMonitor = len(self.monitors)
         # for index, monitor in enumerate(self.monitors):
@@ -125,32 +272,48 @@ class Multimonitor(Monitor):
             monitor.enable = self.enable
             monitor.update(newData)
 
+    def Flush(self, timeout: float = 0):
+        for monitor in self.monitors:
+            monitor.Flush(timeout)
+
+    def Close(self):
+        for monitor in self.monitors:
+            monitor.Close()
+
 class StackedMonitor(Monitor):
     '''A multimonitor that displays multiple monitors in one figure.
     '''
     def __init__(self, name: str, labels: list[str], limits: list[float], 
                  layout: list[int], numLines: int = 0, enable=True, 
-                 targets=["activity"], legendVisibility=True) -> None:
+                 targets=["activity"], legendVisibility=True,
+                 drawInterval: int = None, frameRate: float = 30,
+                 background = False) -> None:
         self.name = name
         self.targets = targets
         self.enable = enable
         self.layout = layout
+        self.legendVisibility = legendVisibility
 
         self.xlabel = labels[0]
         self.ylabel = labels[1]
         self.xlim = limits[0]
         self.ylim = limits[1]
-        
-        # Generate figure and axes based on layout
-        self.sharex = layout[1] == 1
-        self.sharey = layout[0] == 1
-        self.fig, self.axs = plt.subplots(*self.layout, sharex=self.sharex, sharey=self.sharey)
 
         # Initialize data for each target
         self.numTarget = len(self.targets)
         self.data = np.zeros((self.numTarget, self.xlim, numLines))
-        self.lines = [self.axs[i].plot(self.data[i]) for i in range(self.numTarget)]
         self.index = 0
+        self.ymax = 1
+
+        self.InitDisplay(drawInterval, frameRate, background)
+
+    def CreateFigure(self):
+        # Generate figure and axes based on layout
+        import matplotlib.pyplot as plt
+        self.sharex = self.layout[1] == 1
+        self.sharey = self.layout[0] == 1
+        self.fig, self.axs = plt.subplots(*self.layout, sharex=self.sharex, sharey=self.sharey)
+        self.lines = [self.axs[i].plot(self.data[i]) for i in range(self.numTarget)]
 
         # Configure figure and axes labels
         self.fig.suptitle(self.name)
@@ -161,27 +324,26 @@ class StackedMonitor(Monitor):
 
         for i in range(self.numTarget):
             ax = self.axs[i]
-            ax.set_title(targets[i])
+            ax.set_title(self.targets[i])
             if not self.sharex:
                 ax.set_xlabel(self.xlabel)
             if not self.sharey:
                 ax.set_ylabel(self.ylabel)
             ax.set_ylim(0, self.ylim)
-            if legendVisibility:
-                ax.legend(range(numLines))
-
-    def update(self, newData: dict[str, np.array]):
-        if self.enable:
-            for i in range(self.numTarget):
-                self.data[i][self.index] = newData[self.targets[i]]
+            if self.legendVisibility:
+                ax.legend(range(self.data.shape[2]))
 
-                for lineIndex, line in enumerate(self.lines[i]):
-                    line.set_ydata(self.data[i][:, lineIndex])
+    def Record(self, newData: dict[str, np.array]):
+        for i in range(self.numTarget):
+            self.data[i][self.index] = newData[self.targets[i]]
 
-            self.index = self.index + 1 if self.index < self.xlim-1 else 0
+    def Draw(self):
+        for i in range(self.numTarget):
+            for lineIndex, line in enumerate(self.lines[i]):
+                line.set_ydata(self.data[i][:, lineIndex])
 
-            self.fig.canvas.draw()
-            self.fig.canvas.flush_events()
+        self.fig.canvas.draw()
+        self.fig.canvas.flush_events()
 
 class Record(Monitor):
     '''A monitor for recording data without plotting.
@@ -202,6 +364,12 @@ class Record(Monitor):
     def update(self, newData: dict[str, np.array]):
         self.data = np.concatenate((self.data, newData[self.target].reshape(1,-1)))
 
+    def Flush(self, timeout: float = 0):
+        pass
+
+    def Close(self):
+        pass
+
 
 class Heatmap:
     def __init__(self, net: Net, numEpochs: int, numSamples = 50) -> None:
@@ -212,6 +380,7 @@ class Heatmap:
         self.validate()
 
         # Create a directed graph
+        import networkx as nx
         self.G = nx.DiGraph()
         
         # Add nodes
@@ -244,6 +413,8 @@ class Heatmap:
                 raise TypeError(f"Layer [{layer.name}] must use a monitor of type 'Record.'")
 
     def draw(self):
+        import matplotlib.pyplot as plt
+        import networkx as nx
         net  = self.net
         labels = self.labels
 
@@ -271,6 +442,9 @@ class Heatmap:
         plt.show()
     
     def animate(self, fileName, suffix = ".gif"):
+        import matplotlib.pyplot as plt
+        import networkx as nx
+        import imageio
         net  = self.net
         labels = self.labels
         numEpochs = self.numEpochs
@@ -31,4 +31,9 @@ emerIn = df["input"].to_numpy()
 print("In equivalence: ", np.all(np.isclose(emerIn, inAx, rtol=1e-3, atol=1e-3)))
 
 emerOut = df["output"].to_numpy()
-print("Out equivalence: ", np.all(np.isclose(emerOut, outAx, rtol=1e-3, atol=1e-3)))
\ No newline at end of file
+print("Out equivalence: ", np.all(np.isclose(emerOut, outAx, rtol=1e-3, atol=1e-3)))
+# Lookup-table implementation
+lut = act.LookupTable()
+lutOut = lut(inAx)
+print("LUT max error: ", lut.maxError)
+print("LUT out equivalence: ", np.all(np.isclose(emerOut, lutOut, rtol=1e-3, atol=1e-3)))
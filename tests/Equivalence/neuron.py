@@ -7,7 +7,7 @@ from vivilux import *
 from vivilux.learningRules import CHL
 from vivilux.nets import Net, layerConfig_std
 from vivilux.layers import Layer
-from vivilux.meshes import Mesh, AbsMesh
+from vivilux.meshes import Mesh
 from vivilux.metrics import RMSE
 from vivilux.activations import NoisyXX1
 
@@ -68,10 +68,10 @@ emerAct = df["#Act"].to_numpy()
 for step in timeAx:
     neuron.UpdateConductance()
     neuron.StepTime(step)
-    Ge[step] = neuron.Ge * neuron.Gbar["E"]
-    Vm[step] = neuron.Vm
-    Inet[step] = neuron.Inet
-    Act[step] = neuron.getActivity()
+    Ge[step] = neuron.Ge[0] * neuron.Gbar["E"]
+    Vm[step] = neuron.Vm[0]
+    Inet[step] = neuron.Inet[0]
+    Act[step] = neuron.getActivity()[0]
 
 fig, ax = plt.subplots(2,1)
 ax[0].plot(timeAx, Ge, label="Ge")
@@ -99,4 +99,22 @@ plt.show()
 print("Ge equivalence: ", np.all(np.isclose(emerGe, Ge, rtol=1e-3, atol=1e-3)))
 print("Inet equivalence: ", np.all(np.isclose(emerInet, Inet, rtol=1e-3, atol=1e-3)))
 print("Vm equivalence: ", np.all(np.isclose(emerVm, Vm, rtol=1e-3, atol=1e-3)))
-print("Act equivalence: ", np.all(np.isclose(emerAct, Act, rtol=1e-3, atol=0)))
\ No newline at end of file
+print("Act equivalence: ", np.all(np.isclose(emerAct, Act, rtol=1e-3, atol=0)))
+
+# Repeat the simulation with the numba backend (falls back to NumPy)
+neuron.Compile(backend="numba")
+neuron.resetActivity()
+neuron.step = 0
+nbAct = np.zeros(numTimeSteps)
+nbVm = np.zeros(numTimeSteps)
+for step in timeAx:
+    neuron.UpdateConductance()
+    neuron.StepTime(step)
+    nbVm[step] = neuron.Vm[0]
+    nbAct[step] = neuron.getActivity()[0]
+
+print("Backend: ", "numba" if neuron.useNumba else "numpy")
+print("Vm equivalence (numba): ", np.all(np.isclose(emerVm, nbVm, rtol=1e-3, atol=1e-3)))
+print("Act equivalence (numba): ", np.all(np.isclose(emerAct, nbAct, rtol=1e-3, atol=0)))
+print("Max difference from NumPy backend: ", max(np.max(np.abs(nbVm - Vm)),
+                                                 np.max(np.abs(nbAct - Act))))
@@ -0,0 +1,56 @@
+'''Checks the analytic jacobian of each MZI mesh type against central finite
+    differences, then compares the convergence of LAMM against the
+    Levenberg-Marquardt ApplyDelta when implementing reachable matrices.
+'''
+from vivilux import *
+from vivilux.nets import Net
+from vivilux.layers import Layer
+from vivilux.photonics.ph_meshes import MZImesh, DiagMZI, SVDMZI
+
+import numpy as np
+np.random.seed(seed=0)
+
+import time
+
+def MakeMesh(meshType, matrixSize, **meshArgs):
+    dummyLayer = Layer(matrixSize, isInput=True, name="Input")
+    dummyNet = Net(name = "LEABRA_NET")
+    dummyNet.AddLayer(dummyLayer)
+    return meshType(matrixSize, dummyLayer, **meshArgs)
+
+print("--------STARTING TEST: Jacobian--------")
+for meshType in [MZImesh, DiagMZI, SVDMZI]:
+    mesh = MakeMesh(meshType, 5)
+    params = [param.copy() for param in mesh.getParams()]
+    jacobian = mesh.jacobian(params)
+
+    flatParams = np.concatenate([param.flatten() for param in params])
+    numerical = np.zeros(jacobian.shape)
+    h = 1e-6
+    for index in range(len(flatParams)):
+        plusParams, minusParams = flatParams.copy(), flatParams.copy()
+        plusParams[index] += h
+        minusParams[index] -= h
+        plusMatrix = mesh.getFromParams(mesh.reshapeParams(plusParams))
+        minusMatrix = mesh.getFromParams(mesh.reshapeParams(minusParams))
+        numerical[:, :, index] = (plusMatrix - minusMatrix) / (2*h)
+    print(f"{meshType.__name__} max jacobian error: "
+          f"{np.max(np.abs(numerical - jacobian)):0.2e}")
+
+print("--------STARTING TEST: LAMM vs LM--------")
+for meshType in [MZImesh, DiagMZI, SVDMZI]:
+    for deltaMethod in ["LAMM", "LM"]:
+        np.random.seed(seed=0)
+        mesh = MakeMesh(meshType, 8, deltaMethod=deltaMethod)
+        # target is reachable by a perturbation of the params
+        targetParams = [param + 0.2*(np.random.rand(*param.shape)-0.5)
+                        for param in mesh.getParams()]
+        target = mesh.getFromParams(targetParams)
+        initDelta = target - mesh.get()/mesh.Gscale
+        initMagnitude = np.sqrt(np.sum(np.square(initDelta)))
+
+        start = time.time()
+        magnitude, numSteps = mesh.ApplyDelta(initDelta)
+        print(f"{meshType.__name__} {deltaMethod}: initial magnitude "
+              f"{initMagnitude:0.4f}, final magnitude {magnitude:0.2e}, "
+              f"{numSteps+1} steps, {time.time() - start:0.2f}s")
@@ -0,0 +1,319 @@
+'''Headless benchmark suite for comparing the performance of vivilux across
+    commits. Times a fixed set of workloads with pinned seeds at several
+    layer sizes, and writes the results to a JSON file. Passing the results
+    of an earlier run with --compare reports the speedup of each workload
+    and flags regressions, as well as workloads whose results (e.g. the
+    final RMSE) changed.
+
+    Usage:
+        python tests/benchmarks.py --output new.json --compare old.json
+        python tests/benchmarks.py --workloads ra25 iris_MZImesh --scales 4 16
+'''
+from vivilux import *
+from vivilux.nets import Net, layerConfig_std, runConfig_std
+from vivilux.layers import Layer
+from vivilux.meshes import Mesh
+from vivilux.photonics.ph_meshes import MZImesh, DiagMZI, SVDMZI, Crossbar
+from vivilux.photonics.utils import psToRect
+
+import pandas as pd
+import numpy as np
+
+from argparse import ArgumentParser
+from copy import deepcopy
+from datetime import datetime, timezone
+import json
+import pathlib
+import platform
+import subprocess
+import sys
+import time
+from os import cpu_count, path
+
+SEED = 0
+SCALES = [4, 16, 49, 100] # number of neurons in the hidden layers
+REPEATS = 3
+TOLERANCE = 0.1 # relative slowdown reported as a regression
+
+directory = pathlib.Path(__file__).parent.resolve()
+
+###<------ WORKLOADS ------>###
+# Each workload builds its inputs and net for a given scale (untimed) and
+# returns a function running the timed part, which returns a dict of metrics
+# used to check that the results did not change. The nets learn for fewer
+# epochs than the end condition of runConfig_std.
+
+def BuildNet(sizes, meshType = Mesh, meshArgs = {}, backend = None):
+    '''Builds a net of layers with the given sizes, with feedforward
+        connections of the given mesh type and feedback connections.
+    '''
+    net = Net(name = "BENCHMARK_NET", runConfig=runConfig_std)
+    layerList = [Layer(sizes[0], isInput=True, name="Input")]
+    layerList += [Layer(size, name=f"Hidden{index+1}")
+                  for index, size in enumerate(sizes[1:-1])]
+    layerList += [Layer(sizes[-1], isTarget=True, name="Output")]
+    net.AddLayers(layerList[:-1])
+    outputConfig = deepcopy(layerConfig_std)
+    outputConfig["FFFBparams"]["Gi"] = 1.4
+    net.AddLayer(layerList[-1], layerConfig=outputConfig)
+    net.AddConnections(layerList[:-1], layerList[1:],
+                       meshConfig={"meshType": meshType,
+                                   "meshArgs": meshArgs})
+    net.AddConnections(layerList[1:], layerList[:-1],
+                       meshConfig={"meshType": Mesh,
+                                   "meshArgs": {"RelScale": 0.2}})
+    if backend is not None:
+        net.Compile(backend)
+    return net
+
+def RA25(scale, backend = None):
+    '''Learns the ra25 patterns (25 inputs and outputs) with Mesh
+        connections and two hidden layers of the given size.
+    '''
+    numEpochs = 3
+    equivalence = path.join(directory, "Equivalence")
+    patterns = pd.read_csv(path.join(equivalence, "ra25_patterns.csv"))
+    patterns = patterns.drop(labels = "$Name", axis=1)
+    patterns = patterns.to_numpy(dtype="float64")
+    inputs, targets = patterns[:,:25], patterns[:,25:]
+
+    net = BuildNet([25, scale, scale, 25], backend=backend)
+    def run():
+        result = net.Learn(input=inputs, target=targets, numEpochs=numEpochs,
+                           reset=False, shuffle=False, EvaluateFirst=False,
+                           verbosity=0)
+        return {"RMSE": result["RMSE"][-1]}
+    return run
+
+def Iris(meshType):
+    '''Returns a workload learning the iris dataset projected onto inputs of
+        the given size, with feedforward connections of the given mesh type.
+        The three classes are assigned random patterns of output activity.
+    '''
+    def workload(scale, backend = None):
+        from sklearn import datasets
+        numEpochs = 2
+        numSamples = 25
+        numHot = max(1, scale//4)
+
+        iris = datasets.load_iris()
+        data = iris.data/np.max(np.linalg.norm(iris.data, axis=1))
+        projection = data @ np.random.rand(4, scale)
+        inputs = np.zeros((len(data), scale))
+        np.put_along_axis(inputs, np.argsort(-projection)[:,:numHot], 1, axis=1)
+        patterns = np.zeros((3, scale))
+        patterns[:,:numHot] = 1
+        patterns = np.apply_along_axis(np.random.permutation, 1, patterns)
+        targets = patterns[iris.target]
+        shuffle = np.random.permutation(len(inputs))[:numSamples]
+        inputs, targets = inputs[shuffle], targets[shuffle]
+
+        net = BuildNet([scale, scale, scale], meshType,
+                       {"numSteps": 20} if issubclass(meshType, MZImesh) else {},
+                       backend=backend)
+        def run():
+            result = net.Learn(input=inputs, target=targets,
+                               numEpochs=numEpochs, reset=False,
+                               shuffle=False, EvaluateFirst=False, verbosity=0)
+            return {"RMSE": result["RMSE"][-1]}
+        return run
+    return workload
+
+def MZIConvergence(scale, backend = None):
+    '''Implements reachable deltas (from random perturbations of the phase
+        shifts) on an MZI mesh of the given size with ApplyDelta.
+    '''
+    numDeltas = 2
+    layer = Layer(scale, isInput=True, name="Input")
+    net = Net(name = "BENCHMARK_NET")
+    net.AddLayer(layer)
+    mesh = MZImesh(scale, layer, numSteps=20)
+    phaseShifters = [mesh.phaseShifters + 0.1*np.random.randn(*mesh.phaseShifters.shape)
+                     for index in range(numDeltas)]
+    def run():
+        numSteps, residuals = 0, []
+        for phases in phaseShifters:
+            target = np.square(np.abs(psToRect(phases, scale)))
+            delta = target - mesh.get()/mesh.Gscale
+            magnitude, steps = mesh.ApplyDelta(delta)
+            numSteps += steps
+            residuals.append(magnitude/np.linalg.norm(delta))
+        return {"numSteps": numSteps,
+                "numProbes": mesh.numProbes,
+                "residual": float(np.mean(residuals)),
+                }
+    return run
+
+def FFFBSweep(scale, backend = None):
+    '''Infers random inputs through an identity mesh into an output layer
+        for a grid of feedforward and feedback inhibition parameters.
+    '''
+    numSamples = 25
+    inputs = np.random.rand(numSamples, scale)
+    nets = []
+    for Gi in [1.3, 1.8, 2.3]:
+        for FB in [0, 0.5, 1]:
+            outputConfig = deepcopy(layerConfig_std)
+            outputConfig["FFFBparams"]["Gi"] = Gi
+            outputConfig["FFFBparams"]["FB"] = FB
+            net = Net(name = "BENCHMARK_NET", runConfig=runConfig_std)
+            inputLayer = Layer(scale, isInput=True, name="Input")
+            outputLayer = Layer(scale, isTarget=True, name="Output")
+            net.AddLayer(inputLayer)
+            net.AddLayer(outputLayer, layerConfig=outputConfig)
+            net.AddConnection(inputLayer, outputLayer).set(np.eye(scale))
+            if backend is not None:
+                net.Compile(backend)
+            nets.append(net)
+    def run():
+        activity = [np.mean(net.Infer(input=inputs, verbosity=0)["target"])
+                    for net in nets]
+        return {"activity": float(np.mean(activity))}
+    return run
+
+def ImportTime(scale = None, backend = None):
+    '''Imports vivilux in a fresh interpreter.
+    '''
+    def run():
+        subprocess.run([sys.executable, "-c", "import vivilux"], check=True)
+        return {}
+    return run
+
+# default scales of each workload; learning with MZI meshes is limited to
+# small layers since a single LAMM update of a 100x100 MZI takes minutes
+WORKLOADS = {
+    "ra25": (RA25, SCALES),
+    "iris_MZImesh": (Iris(MZImesh), [4, 16]),
+    "iris_DiagMZI": (Iris(DiagMZI), [4, 16]),
+    "iris_SVDMZI": (Iris(SVDMZI), [4, 16]),
+    "iris_Crossbar": (Iris(Crossbar), SCALES),
+    "MZI_ApplyDelta": (MZIConvergence, [4, 16, 49]),
+    "FFFB_sweep": (FFFBSweep, SCALES),
+    "import": (ImportTime, [None]),
+}
+
+###<------ RUNNER ------>###
+
+def GitCommit():
+    '''Returns the current commit and whether the working tree is modified.
+    '''
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=directory,
+                                check=True, capture_output=True, text=True)
+        status = subprocess.run(["git", "status", "--porcelain", "-uno"],
+                                cwd=directory, check=True,
+                                capture_output=True, text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit.stdout.strip(), len(status.stdout.strip()) > 0
+
+def Benchmark(name, scale, repeats, backend = None):
+    '''Times a workload, rebuilding it with the same seed for each repeat.
+    '''
+    times = []
+    for repeat in range(repeats):
+        np.random.seed(seed=SEED)
+        workload, _ = WORKLOADS[name]
+        run = workload(scale, backend=backend)
+        start = time.perf_counter()
+        metrics = run()
+        times.append(time.perf_counter() - start)
+    return {"workload": name,
+            "scale": scale,
+            "times": times,
+            "median": float(np.median(times)),
+            "min": float(np.min(times)),
+            "metrics": {key: float(value) for key, value in metrics.items()},
+            }
+
+def Compare(results, baseline, tolerance = TOLERANCE):
+    '''Prints the speedup of each workload relative to the baseline results,
+        using the fastest repeat which is the least affected by other load on
+        the machine. Returns the number of regressions.
+    '''
+    reference = {(entry["workload"], entry["scale"]): entry
+                 for entry in baseline["results"]}
+    print(f"Comparing against {baseline['commit']} ({baseline['date']}):")
+    numRegressions = 0
+    for entry in results["results"]:
+        key = (entry["workload"], entry["scale"])
+        label = f"{entry['workload']}[{entry['scale']}]"
+        if key not in reference or "skipped" in entry or "skipped" in reference[key]:
+            print(f"\t{label:<24} not comparable")
+            continue
+        old = reference[key]
+        speedup = old["min"]/entry["min"]
+        notes = []
+        if entry["min"] > (1 + tolerance) * old["min"]:
+            notes.append("REGRESSION")
+            numRegressions += 1
+        elif entry["min"] < (1 - tolerance) * old["min"]:
+            notes.append("faster")
+        for metric, value in entry["metrics"].items():
+            oldValue = old["metrics"].get(metric)
+            if oldValue is None or not np.isclose(value, oldValue, rtol=1e-6):
+                notes.append(f"{metric} changed ({oldValue} -> {value})")
+        print(f"\t{label:<24}{old['min']:>10.3f}s ->{entry['min']:>9.3f}s"
+              f"  x{speedup:0.2f}  {', '.join(notes)}".rstrip())
+    return numRegressions
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Runs the vivilux benchmark suite.")
+    parser.add_argument("--workloads", nargs="+", default=list(WORKLOADS),
+                        choices=list(WORKLOADS))
+    parser.add_argument("--scales", nargs="+", type=int, default=None,
+                        help="overrides the default scales of the workloads")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--backend", default=None,
+                        help="compile the nets with Net.Compile(backend)")
+    parser.add_argument("--output", default=None,
+                        help="JSON file for the results (default: "
+                        "benchmarks_<commit>.json)")
+    parser.add_argument("--compare", default=None,
+                        help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    commit, isModified = GitCommit()
+    results = {
+        "commit": commit,
+        "modified": isModified,
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpuCount": cpu_count(),
+        "backend": args.backend,
+        "seed": SEED,
+        "repeats": args.repeats,
+        "results": [],
+    }
+    for name in args.workloads:
+        _, scales = WORKLOADS[name]
+        if args.scales is not None and scales != [None]:
+            scales = args.scales
+        for scale in scales:
+            label = f"{name}[{scale}]"
+            try:
+                entry = Benchmark(name, scale, args.repeats, args.backend)
+            except ImportError as error: # optional dependencies (e.g. sklearn)
+                entry = {"workload": name, "scale": scale,
+                         "skipped": str(error)}
+                print(f"{label:<24} skipped ({error})", flush=True)
+            else:
+                print(f"{label:<24} median {entry['median']:0.3f}s, "
+                      f"min {entry['min']:0.3f}s {entry['metrics']}", flush=True)
+            results["results"].append(entry)
+
+    output = args.output
+    if output is None:
+        output = f"benchmarks_{(commit or 'unknown')[:8]}.json"
+    with open(output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        numRegressions = Compare(results, baseline, args.tolerance)
+        sys.exit(1 if numRegressions > 0 else 0)
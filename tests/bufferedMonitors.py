@@ -0,0 +1,74 @@
+'''Compares the training time of a small net with monitors redrawn on every
+    time step (drawInterval=1), throttled to the default frame rate, and drawn
+    by a background process. The monitors should display the same traces
+    while the throttled and background monitors slow the training down far
+    less than redrawing on every step.
+'''
+from vivilux import *
+from vivilux.nets import Net
+from vivilux.layers import Layer
+from vivilux.meshes import Mesh
+from vivilux.visualize import Monitor, Magnitude, StackedMonitor
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+import time
+
+numSamples = 5
+numEpochs = 1
+inputSize = 4
+hiddenSize = 16
+outputSize = 4
+
+def BuildNet(monitoring: bool, **monitorArgs):
+    np.random.seed(seed=0)
+    net = Net(name = "LEABRA_NET", monitoring=monitoring)
+    inLayer = Layer(inputSize, isInput=True, name="Input")
+    hidden = Layer(hiddenSize, name="Hidden")
+    outLayer = Layer(outputSize, isTarget=True, name="Output")
+    net.AddLayers([inLayer, hidden, outLayer])
+    net.AddConnection(inLayer, hidden)
+    net.AddConnection(hidden, outLayer)
+    net.AddConnection(outLayer, hidden, {"meshType": Mesh,
+                                         "meshArgs": {"RelScale": 0.2}})
+    if monitoring:
+        inLayer.AddMonitor(Monitor("Input", labels=["time step", "activity"],
+                                   limits=[100, 2], numLines=inputSize,
+                                   **monitorArgs))
+        hidden.AddMonitor(Magnitude("Hidden", labels=["time step", "activity"],
+                                    limits=[100, 2], numLines=hiddenSize,
+                                    **monitorArgs))
+        outLayer.AddMonitor(StackedMonitor("Output",
+                                           labels=["time step", "activity"],
+                                           limits=[100, 2], layout=[2, 1],
+                                           numLines=outputSize,
+                                           targets=["activity", "Ge"],
+                                           **monitorArgs))
+    return net
+
+if __name__ == "__main__": # background monitors may spawn processes
+    np.random.seed(seed=0)
+    inputs = np.random.rand(numSamples, inputSize)
+    targets = np.random.rand(numSamples, outputSize)
+
+    modes = {"no monitors": (False, {}),
+             "every step": (True, {"drawInterval": 1}),
+             "30 fps": (True, {"frameRate": 30}),
+             "background": (True, {"background": True}),
+             }
+    for mode, (monitoring, monitorArgs) in modes.items():
+        net = BuildNet(monitoring, **monitorArgs)
+        start = time.time()
+        result = net.Learn(input=inputs, target=targets, numEpochs=numEpochs,
+                           reset=False, shuffle=False, EvaluateFirst=False,
+                           verbosity=0)
+        learnTime = time.time() - start
+        print(f"{mode}: learn {learnTime:0.2f}s, RMSE "
+              f"{np.round(result['RMSE'], 4)}")
+
+    # background monitors keep their figures open until they are closed
+    for layer in net.layers:
+        for monitor in layer.monitors.values():
+            monitor.Close()
+    plt.show()
@@ -0,0 +1,45 @@
+'''Benchmarks the time to import vivilux in a fresh interpreter, and lists the
+    slowest modules reported by `python -X importtime`. Importing vivilux
+    should not pull in matplotlib, networkx, imageio, scipy or numba, or fit
+    the photonic neuron models.
+'''
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+numRepeats = 10
+heavyModules = ["matplotlib", "networkx", "imageio", "scipy", "numba"]
+
+importTimes = []
+for repeat in range(numRepeats):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import vivilux"], check=True)
+    importTimes.append(time.perf_counter() - start)
+baseTimes = []
+for repeat in range(numRepeats):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import numpy"], check=True)
+    baseTimes.append(time.perf_counter() - start)
+print(f"import vivilux: median {np.median(importTimes):0.3f}s "
+      f"(interpreter + numpy: {np.median(baseTimes):0.3f}s)")
+
+# modules loaded as a side effect of the import
+check = ("import sys, vivilux; "
+         f"print(*[name for name in {heavyModules} if name in sys.modules])")
+loaded = subprocess.run([sys.executable, "-c", check], check=True,
+                        capture_output=True, text=True).stdout.split()
+print(f"Heavy modules loaded on import: {loaded if loaded else 'none'}")
+
+# cumulative import time (us) of each module
+report = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                         "import vivilux"],
+                        check=True, capture_output=True, text=True).stderr
+modules = []
+for line in report.splitlines()[1:]:
+    _, cumulative, name = line.split("|")
+    modules.append((int(cumulative), name.rstrip()))
+print("Slowest modules (cumulative):")
+for cumulative, name in sorted(modules, reverse=True)[:10]:
+    print(f"\t{cumulative/1e3:8.1f} ms {name}")
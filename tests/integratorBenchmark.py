@@ -0,0 +1,124 @@
+'''Benchmarks the exponential integrator against the default Euler integrator
+    on the ra25 task. The exponential integrator is run with larger time steps
+    (DtParams["Integ"]) and proportionally fewer time steps per phase, and the
+    learning curve, inference outputs and wall-clock time are compared.
+'''
+from vivilux import *
+from vivilux.nets import Net, layerConfig_std, phaseConfig_std
+from vivilux.layers import Layer
+from vivilux.meshes import Mesh
+from vivilux.metrics import ThrMSE, ThrSSE
+
+import pandas as pd
+import numpy as np
+
+from copy import deepcopy
+import pathlib
+from os import path
+import json
+import time
+
+numEpochs = 10
+inputSize = 5*5
+hiddenSize = 7*7
+outputSize = 5*5
+
+#define input and output data of one-hot patterns
+directory = path.join(pathlib.Path(__file__).parent.resolve(), "Equivalence")
+patterns = pd.read_csv(path.join(directory, "ra25_patterns.csv"))
+patterns = patterns.drop(labels = "$Name", axis=1)
+patterns = patterns.to_numpy(dtype="float64")
+inputs = patterns[:,:inputSize]
+targets = patterns[:,inputSize:]
+
+input_perm = pd.read_csv(path.join(directory, "ra25_input_permutation.csv"))
+input_perm = input_perm.columns.to_numpy(dtype="int")
+inputs = inputs[input_perm]
+targets = targets[input_perm]
+
+with open(path.join(directory, "ra25_weights.json")) as weightsFile:
+    weights = json.load(weightsFile)
+
+leabraRunConfig = {
+    "DELTA_TIME": 0.001,
+    "metrics": {
+        "AvgSSE": ThrMSE,
+        "SSE": ThrSSE,
+    },
+    "outputLayers": {
+        "target": -1,
+    },
+    "Learn": ["minus", "plus"],
+    "Infer": ["minus"],
+    "End": {
+        "threshold": 0,
+        "isLower": True,
+        "numEpochs": 5,
+    },
+}
+
+def BuildNet(integrator: str, integ: float):
+    '''Builds the ra25 network with the given integrator and time step, with
+        the number of time steps of each phase reduced by the same factor.
+    '''
+    np.random.seed(seed=0)
+    phaseConfig = deepcopy(phaseConfig_std)
+    for phase in phaseConfig.values():
+        phase["numTimeSteps"] = int(round(phase["numTimeSteps"] / integ))
+    layerConfig = deepcopy(layerConfig_std)
+    layerConfig["DtParams"]["Integ"] = integ
+    layerConfig["DtParams"]["Integrator"] = integrator
+    outputConfig = deepcopy(layerConfig)
+    outputConfig["FFFBparams"]["Gi"] = 1.4
+
+    net = Net(name = f"RA25_{integrator}_{integ}",
+              runConfig=leabraRunConfig,
+              phaseConfig=phaseConfig,
+              )
+    layerList = [Layer(inputSize, isInput=True, name="Input"),
+                 Layer(hiddenSize, name="Hidden1"),
+                 Layer(hiddenSize, name="Hidden2"),
+                 Layer(outputSize, isTarget=True, name="Output")]
+    net.AddLayers(layerList[:-1], layerConfig=layerConfig)
+    net.AddLayer(layerList[-1], layerConfig=outputConfig)
+
+    # Add connections with the same initial weights as ra25.go
+    for layer in weights["Layers"]:
+        netLayer = net.layerDict[layer["Layer"]]
+        if layer["Prjns"] is None: continue
+        for prjn in layer["Prjns"]:
+            sndLayer = net.layerDict[prjn["From"]]
+            isFeedback = net.layers.index(sndLayer) > net.layers.index(netLayer)
+            mesh = net.AddConnection(sndLayer, netLayer,
+                                     {"meshType": Mesh,
+                                      "meshArgs": {
+                                          "AbsScale": int(prjn["MetaData"]["GScale"]),
+                                          "RelScale": 0.2 if isFeedback else 1,
+                                          }
+                                      })
+            for rs in prjn["Rs"]:
+                mesh.matrix[rs["Ri"], rs["Si"]] = rs["Wt"]
+            mesh.InvSigMatrix()
+    return net
+
+configs = [("euler", 1), ("euler", 2), ("euler", 4),
+           ("exponential", 1), ("exponential", 2), ("exponential", 4)]
+reference = None
+for integrator, integ in configs:
+    net = BuildNet(integrator, integ)
+    start = time.time()
+    result = net.Learn(input=inputs, target=targets, numEpochs=numEpochs,
+                       reset=False, shuffle=False, EvaluateFirst=False,
+                       verbosity=0)
+    learnTime = time.time() - start
+    start = time.time()
+    inference = np.array(net.Infer(input=inputs, verbosity=0)["target"])
+    inferTime = time.time() - start
+
+    if reference is None:
+        reference = inference
+    print(f"{integrator} (Integ={integ}): learn {learnTime:0.2f}s, "
+          f"infer {inferTime:0.2f}s")
+    print("\tSSE: ", np.round(result["SSE"], 2))
+    print(f"\tMean absolute difference from Euler inference: "
+          f"{np.mean(np.abs(inference - reference)):0.4f}")
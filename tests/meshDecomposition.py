@@ -0,0 +1,102 @@
+'''Checks the closed-form decomposition of unitaries into rectangular MZI
+    meshes and compares programming each mesh type with set() against
+    implementing the same matrices iteratively with LAMM. Power matrices of
+    unitaries are reachable by every mesh, so set() should recover them.
+'''
+from vivilux import *
+from vivilux.nets import Net
+from vivilux.layers import Layer
+from vivilux.photonics.ph_meshes import MZImesh, DiagMZI, SVDMZI
+from vivilux.photonics.utils import psToRect, rectDecompose
+
+import numpy as np
+from scipy.stats import unitary_group
+np.random.seed(seed=0)
+
+import time
+
+print("--------STARTING TEST: Unitary decomposition--------")
+for matrixSize in [2, 3, 4, 7, 8, 16]:
+    unitary = unitary_group.rvs(matrixSize)
+    phaseShifters, outputPhases = rectDecompose(unitary)
+    implemented = np.diag(outputPhases) @ psToRect(phaseShifters, matrixSize)
+    print(f"Size {matrixSize}: max error {np.max(np.abs(implemented - unitary)):0.2e}")
+
+print("--------STARTING TEST: Programming meshes--------")
+matrixSize = 8
+for meshType in [MZImesh, DiagMZI, SVDMZI]:
+    # power matrix of a random unitary (with row gains for DiagMZI)
+    target = np.square(np.abs(unitary_group.rvs(matrixSize)))
+    if meshType is not MZImesh:
+        target *= np.random.rand(matrixSize, 1)
+    targetMagnitude = np.sqrt(np.sum(np.square(target)))
+
+    for method in ["decompose", "LAMM"]:
+        dummyLayer = Layer(matrixSize, isInput=True, name="Input")
+        dummyNet = Net(name = "LEABRA_NET")
+        dummyNet.AddLayer(dummyLayer)
+        mesh = meshType(matrixSize, dummyLayer)
+
+        start = time.time()
+        if method == "decompose":
+            magnitude, numSteps = mesh.set(target)
+        else:
+            delta = target - mesh.get()/mesh.Gscale
+            magnitude, numSteps = mesh.ApplyDelta(delta)
+        print(f"{meshType.__name__} {method}: relative error "
+              f"{magnitude/targetMagnitude:0.2e}, {numSteps} LAMM steps, "
+              f"{time.time() - start:0.3f}s")
+        if method == "decompose": # the targets are reachable by each mesh
+            assert magnitude/targetMagnitude < 1e-8, "target not recovered"
+
+print("--------STARTING TEST: Recovering reachable power matrices--------")
+for matrixSize in [4, 8]:
+    errors = []
+    start = time.time()
+    for _ in range(10):
+        dummyLayer = Layer(matrixSize, isInput=True, name="Input")
+        dummyNet = Net(name = "LEABRA_NET")
+        dummyNet.AddLayer(dummyLayer)
+        mesh = MZImesh(matrixSize, dummyLayer)
+        target = np.square(np.abs(unitary_group.rvs(matrixSize)))
+        magnitude, _ = mesh.set(target)
+        errors.append(magnitude/np.sqrt(np.sum(np.square(target))))
+    print(f"Size {matrixSize}: max relative error {np.max(errors):0.2e}, "
+          f"{(time.time() - start)/len(errors):0.3f}s per target")
+    assert np.max(errors) < 1e-8, "target not recovered"
+
+print("--------STARTING TEST: Programming a mesh without decomposition--------")
+class VoltageMZI(MZImesh):
+    '''Rectangular MZI programmed by voltages (like HardMZI) instead of phase
+        shifts, so set() falls back to ApplyDelta.
+    '''
+    hasDecomposition = False
+    voltsPerRadian = 0.5
+
+    def Initialize(self):
+        self.voltages = np.random.rand(self.numUnits,2)*2*np.pi*self.voltsPerRadian
+        self.concavity = 1.5
+
+    def getParams(self):
+        return [self.voltages]
+
+    def setParams(self, params):
+        self.voltages = params[0]
+        self.modified = True
+        self.WeightsChanged()
+
+    def getFromParams(self, params = None):
+        params = self.getParams() if params is None else params
+        phaseShifters = params[0]/self.voltsPerRadian
+        return np.square(np.abs(psToRect(phaseShifters, self.size)))
+
+dummyLayer = Layer(matrixSize, isInput=True, name="Input")
+dummyNet = Net(name = "LEABRA_NET")
+dummyNet.AddLayer(dummyLayer)
+mesh = VoltageMZI(matrixSize, dummyLayer)
+target = np.square(np.abs(unitary_group.rvs(matrixSize)))
+start = time.time()
+magnitude, numSteps = mesh.set(target)
+print(f"VoltageMZI set: relative error "
+      f"{magnitude/np.sqrt(np.sum(np.square(target))):0.2e}, "
+      f"{numSteps} LAMM steps, {time.time() - start:0.3f}s")
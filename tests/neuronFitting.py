@@ -1,8 +1,8 @@
 from vivilux.activations import NoisyXX1
+from vivilux.photonics.neurons import FitScaling
 
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
 
 data = np.genfromtxt("photonicNeuron.csv", delimiter=",", skip_header=1)
 x = data[:,0]
@@ -22,7 +22,7 @@ actFn = NoisyXX1(Thr = 0.5, # threshold value Theta (Q) for firing output activa
 def scalingFn(x, A, B, C):
     return A*actFn(B*(x-C))
 
-popt, _ = curve_fit(scalingFn, x, y, p0=(77, 1/250, 15))
+popt = FitScaling(scalingFn, x, y, p0=(77, 1/250, 15))
 print(f"Firing rate scaling (MHz): {popt[0]}")
 print(f"Input current scaling (µA): {popt[1]}")
 print(f"Threshold current (µA): {popt[2]}")
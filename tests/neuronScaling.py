@@ -1,6 +1,7 @@
 from vivilux import *
 from vivilux.nets import Net, layerConfig_std
 from vivilux.activations import NoisyXX1
+from vivilux.photonics.neurons import FitScaling
 from vivilux.visualize import Record
 from vivilux.layers import Layer
 from vivilux.meshes import Mesh
@@ -8,7 +9,6 @@ from vivilux.metrics import RMSE, ThrMSE, ThrSSE
 
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
 np.random.seed(seed=0)
 
 from copy import deepcopy
@@ -32,7 +32,7 @@ actFn = NoisyXX1(Thr = 0.5, # threshold value Theta (Q) for firing output activa
 def scalingFn(x, A, B, C):
     return A*actFn(B*(x-C))
 
-popt, _ = curve_fit(scalingFn, x, y, p0=(77, 1/250, 15))
+popt = FitScaling(scalingFn, x, y, p0=(77, 1/250, 15))
 print(f"Firing rate scaling (MHz): {popt[0]}")
 print(f"Input current scaling (µA): {popt[1]}")
 print(f"Threshold current (µA): {popt[2]}")
@@ -0,0 +1,67 @@
+'''Compares updating the MZI meshes of a net serially against updating them
+    concurrently with Net.ParallelLearn. With the same seed, the per-mesh
+    random streams should give identical weights for any number of workers.
+'''
+from vivilux import *
+from vivilux.nets import Net
+from vivilux.layers import Layer
+from vivilux.meshes import Mesh
+from vivilux.photonics.ph_meshes import MZImesh
+
+import numpy as np
+
+import copy
+import os
+import time
+
+numSamples = 10
+numEpochs = 3
+sizes = [8, 16, 16, 8]
+
+np.random.seed(seed=0)
+inputs = np.random.rand(numSamples, sizes[0])
+targets = np.eye(sizes[-1])[np.random.randint(0, sizes[-1], numSamples)]
+
+def BuildNet():
+    np.random.seed(seed=0)
+    net = Net(name = "LEABRA_NET")
+    layerList = [Layer(sizes[0], isInput=True, name="Input")]
+    layerList += [Layer(size, name=f"Hidden{index}")
+                  for index, size in enumerate(sizes[1:-1])]
+    layerList += [Layer(sizes[-1], isTarget=True, name="Output")]
+    net.AddLayers(layerList)
+    net.AddConnections(layerList[:-1], layerList[1:],
+                       meshConfig={"meshType": MZImesh,
+                                   "meshArgs": {"numSteps": 50}})
+    net.AddConnections(layerList[1:], layerList[:-1],
+                       meshConfig={"meshType": Mesh,
+                                   "meshArgs": {"RelScale": 0.2}})
+    return net
+
+reference = None
+for numWorkers in [1, 2, max(os.cpu_count(), 2)]:
+    net = BuildNet()
+    net.ParallelLearn(numWorkers=numWorkers, seed=0)
+    start = time.time()
+    result = net.Learn(input=inputs, target=targets, numEpochs=numEpochs,
+                       reset=False, verbosity=0)
+    learnTime = time.time() - start
+    weights = np.concatenate([mesh.get().ravel() for layer in net.layers
+                              for mesh in layer.excMeshes])
+    if reference is None:
+        reference = weights
+    print(f"{numWorkers} workers: learn {learnTime:0.2f}s, RMSE "
+          f"{np.round(result['RMSE'], 3)}, max weight difference "
+          f"{np.max(np.abs(weights - reference)):0.2e}")
+
+# The thread pool is left out of copies, which create their own when learning
+copied = copy.deepcopy(net)
+for clone in [net, copied]:
+    clone.Learn(input=inputs, target=targets, numEpochs=1, reset=False,
+                shuffle=False, EvaluateFirst=False, verbosity=0)
+weights = [np.concatenate([mesh.get().ravel() for layer in clone.layers
+                           for mesh in layer.excMeshes])
+           for clone in [net, copied]]
+print(f"copy after learning: max weight difference "
+      f"{np.max(np.abs(weights[1] - weights[0])):0.2e}, separate pools "
+      f"{copied.learnPool is not net.learnPool}")
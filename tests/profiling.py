@@ -0,0 +1,67 @@
+'''Profiles the hot stages of training a small net with an MZI mesh using
+    Net.Learn(profile=True), and compares the training time against an
+    unprofiled run with the same seed.
+'''
+from vivilux import *
+from vivilux.nets import Net
+from vivilux.layers import Layer
+from vivilux.meshes import Mesh
+from vivilux.photonics.ph_meshes import MZImesh
+
+import numpy as np
+
+import time
+
+numSamples = 10
+numEpochs = 3
+
+np.random.seed(seed=0)
+inputs = np.random.rand(numSamples, 8)
+targets = np.eye(4)[np.random.randint(0, 4, numSamples)]
+
+def BuildNet():
+    np.random.seed(seed=0)
+    net = Net(name = "LEABRA_NET")
+    layerList = [Layer(8, isInput=True, name="Input"),
+                 Layer(16, name="Hidden"),
+                 Layer(4, isTarget=True, name="Output")]
+    net.AddLayers(layerList)
+    net.AddConnection(layerList[0], layerList[1],
+                      {"meshType": MZImesh, "meshArgs": {"numSteps": 50}})
+    net.AddConnection(layerList[1], layerList[2])
+    net.AddConnections(layerList[1:], layerList[:-1],
+                       {"meshType": Mesh, "meshArgs": {"RelScale": 0.2}})
+    return net
+
+for profile in [False, True]:
+    net = BuildNet()
+    start = time.time()
+    result = net.Learn(input=inputs, target=targets, numEpochs=numEpochs,
+                       reset=False, EvaluateFirst=False, verbosity=0,
+                       profile=profile)
+    learnTime = time.time() - start
+    if profile:
+        result, report = result
+    print(f"profile={profile}: learn {learnTime:0.2f}s, RMSE "
+          f"{np.round(result['RMSE'], 3)}")
+
+print(net.profiler.Summary())
+print("Seconds per epoch:")
+for stage, epochTimes in zip(report["stages"], report["epochs"].T):
+    print(f"\t{stage:<20}{np.round(epochTimes, 3)}")
+
+# profiling must not change the backend of the layers or miss the mesh
+# updates run by the ParallelLearn pool
+net = BuildNet()
+net.Compile("numba")
+net.ParallelLearn(numWorkers=2)
+useNumba = [layer.useNumba for layer in net.layers]
+result, report = net.Learn(input=inputs, target=targets, numEpochs=numEpochs,
+                           reset=False, EvaluateFirst=False, verbosity=0,
+                           profile=True)
+print(f"Numba backend kept while profiling: "
+      f"{[layer.useNumba for layer in net.layers] == useNumba} ({useNumba})")
+print(f"Pooled mesh updates: Net.UpdateMeshes "
+      f"{report['total']['Net.UpdateMeshes']:0.3f}s, Mesh.Update "
+      f"{report['total']['Mesh.Update']:0.3f}s "
+      f"({report['calls']['Mesh.Update']} calls)")
@@ -0,0 +1,65 @@
+'''Compares inference by solving for the steady state of each phase against
+    time stepping the phase, on a small random network.
+'''
+from vivilux import *
+from vivilux.nets import Net, solverConfig_std
+from vivilux.layers import Layer
+from vivilux.meshes import Mesh
+
+import numpy as np
+np.random.seed(seed=0)
+
+from copy import deepcopy
+from itertools import product
+import time
+
+layerSize = 4
+inputs = np.array(list(product(*[np.arange(0, 1, 0.25)] * layerSize))) # 256 inputs
+
+net = Net(name = "STEADY_STATE_NET")
+layerList = [Layer(layerSize, isInput=True, name="Input"),
+             Layer(2*layerSize, name="Hidden"),
+             Layer(layerSize, isTarget=True, name="Output")]
+net.AddLayers(layerList)
+net.AddConnections(layerList[:-1], layerList[1:],
+                   meshConfig={"meshType": Mesh, "meshArgs": {}})
+net.AddConnections(layerList[1:], layerList[:-1],
+                   meshConfig={"meshType": Mesh, "meshArgs": {"RelScale": 0.2}})
+solvedNet = deepcopy(net)
+batchedNet = deepcopy(net)
+
+start = time.time()
+stepped = np.array(net.Infer(input=inputs, reset=True, verbosity=0)["target"])
+steppedTime = time.time() - start
+
+start = time.time()
+solved = np.array(solvedNet.Infer(input=inputs, reset=True, verbosity=0,
+                                  solver=solverConfig_std)["target"])
+solvedTime = time.time() - start
+
+results = solvedNet.results
+print(f"Time stepping {steppedTime:0.2f}s, steady state {solvedTime:0.2f}s")
+print(f"Mean iterations: {np.mean(results['iterations'][-1]):0.1f}, "
+      f"max residual: {np.max(results['residual'][-1]):0.2e}, "
+      f"converged: {np.sum(results['converged'][-1])}/{len(inputs)}")
+print(f"Mean absolute difference: {np.mean(np.abs(stepped - solved)):0.4f}")
+print("Same winning unit: ", np.mean(np.argmax(stepped, axis=1) ==
+                                     np.argmax(solved, axis=1)))
+
+# Batched samples are solved independently and only the samples which do not
+# converge are time stepped
+start = time.time()
+batched = np.array(batchedNet.Infer(input=inputs, batchSize=64, verbosity=0,
+                                    solver=solverConfig_std)["target"])
+batchedTime = time.time() - start
+
+batchedResults = batchedNet.results
+print(f"Batched steady state {batchedTime:0.2f}s")
+print(f"Mean iterations: {np.mean(batchedResults['iterations'][-1]):0.1f}, "
+      f"converged: {np.sum(batchedResults['converged'][-1])}/{len(inputs)}")
+bothConverged = batchedResults["converged"][-1] & results["converged"][-1]
+print(f"Converged in both: {np.sum(bothConverged)}/{len(inputs)}, max "
+      f"difference from serial "
+      f"{np.max(np.abs(batched - solved)[bothConverged]):0.2e}, max "
+      f"iteration difference "
+      f"{np.max(np.abs(batchedResults['iterations'][-1] - results['iterations'][-1])[bothConverged])}")